@@ -0,0 +1,493 @@
+"""
+Local stand-ins for the OpenAI Assistants API and Supabase (PostgREST + auth),
+good enough to drive main.app end to end without network access or cost.
+
+Every request is counted per service and delayed by a configurable latency.
+"""
+import asyncio
+import json
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+PARSER_REPLY = '```json\n{"price_usd": 500, "availability": "next week", "discounts": null, "status": "negotiating"}\n```'
+MANAGER_REPLY = (
+    "Thanks, that sounds great! Could you also tell me whether you have any free slots next week "
+    "and if you offer a discount for a bundle of three posts?"
+)
+
+SUMMARY_REPLY = "The blogger quoted $500 per integration and is free next week; a discount for three posts is still being discussed."
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="microseconds")
+
+
+def normalize_timestamp(value: Optional[str]) -> str:
+    if not value:
+        return now_iso()
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat(timespec="microseconds")
+
+
+class FakeConfig:
+    def __init__(self, openai_latency: float = 0.05, supabase_latency: float = 0.01, run_latency: float = 0.5, stream_chunks: int = 20):
+        self.openai_latency = openai_latency
+        self.supabase_latency = supabase_latency
+        self.run_latency = run_latency
+        self.stream_chunks = stream_chunks
+
+
+# ───────────────
+# PostgREST filters
+# ───────────────
+
+def _split_top_level(expr: str) -> List[str]:
+    parts, depth, quoted, current = [], 0, False, ""
+    for ch in expr:
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        if ch == "," and depth == 0 and not quoted:
+            parts.append(current)
+            current = ""
+        else:
+            current += ch
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _compare(row: Dict[str, Any], column: str, op: str, raw: str) -> bool:
+    value = raw.strip('"')
+    actual = row.get(column)
+    if op == "is":
+        return actual is None if value == "null" else str(actual).lower() == value
+    if actual is None:
+        return False
+    if column.endswith("_at"):
+        actual, value = normalize_timestamp(str(actual)), normalize_timestamp(value)
+    else:
+        actual = str(actual)
+    if op == "eq":
+        return actual == value
+    if op == "neq":
+        return actual != value
+    if op == "gt":
+        return actual > value
+    if op == "gte":
+        return actual >= value
+    if op == "lt":
+        return actual < value
+    if op == "lte":
+        return actual <= value
+    if op == "in":
+        return actual in value.strip("()").split(",")
+    raise ValueError(f"Unsupported operator {op}")
+
+
+def _matches_term(row: Dict[str, Any], term: str) -> bool:
+    for logic in ("and", "or"):
+        if term.startswith(f"{logic}("):
+            terms = _split_top_level(term[len(logic) + 1:-1])
+            results = (_matches_term(row, t) for t in terms)
+            return all(results) if logic == "and" else any(results)
+    column, op, value = term.split(".", 2)
+    return _compare(row, column, op, value)
+
+
+def apply_filters(rows: List[Dict[str, Any]], params) -> List[Dict[str, Any]]:
+    result = rows
+    for key, value in params.multi_items():
+        if key in ("select", "order", "limit", "offset", "on_conflict", "columns"):
+            continue
+        if key in ("or", "and"):
+            expr = f"{key}{value}"
+        else:
+            expr = f"{key}.{value}"
+        result = [row for row in result if _matches_term(row, expr)]
+    order = params.get("order")
+    if order:
+        for spec in reversed(order.split(",")):
+            column, _, direction = spec.partition(".")
+            desc = direction.startswith("desc")
+            present = [r for r in result if r.get(column) is not None]
+            missing = [r for r in result if r.get(column) is None]
+            present.sort(key=lambda r: str(r[column]), reverse=desc)
+            result = present + missing
+    return result
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.tables: Dict[str, List[Dict[str, Any]]] = {"chats": [], "messages": [], "deals": []}
+
+    def user_for_token(self, token: str) -> Optional[Dict[str, Any]]:
+        # Tokens look like "bench:<role>:<n>"
+        parts = token.split(":")
+        if len(parts) != 3 or parts[0] != "bench":
+            return None
+        role = parts[1]
+        return {
+            "id": str(uuid.uuid5(uuid.NAMESPACE_URL, token)),
+            "aud": "authenticated",
+            "role": "authenticated",
+            "email": f"{role}{parts[2]}@bench.local",
+            "app_metadata": {},
+            "user_metadata": {"role": role},
+            "created_at": now_iso(),
+        }
+
+    def prepare_row(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        row = dict(row)
+        row.setdefault("id", str(uuid.uuid4()))
+        if table == "deals":
+            row["updated_at"] = now_iso()
+            row.setdefault("status", "negotiating")
+        else:
+            row["created_at"] = normalize_timestamp(row.get("created_at"))
+        return row
+
+    def write(self, table: str, payload: Any, on_conflict: Optional[str], merge: bool, ignore: bool) -> List[Dict[str, Any]]:
+        rows = payload if isinstance(payload, list) else [payload]
+        stored = self.tables.setdefault(table, [])
+        written = []
+        keys = on_conflict.split(",") if on_conflict else []
+        for incoming in rows:
+            if keys:
+                existing = next((r for r in stored if all(r.get(k) == incoming.get(k) for k in keys)), None)
+                if existing is not None:
+                    if merge:
+                        existing.update({k: v for k, v in incoming.items() if k != "id"})
+                        if table == "deals":
+                            existing["updated_at"] = now_iso()
+                        written.append(existing)
+                    elif not ignore:
+                        raise ValueError("duplicate key")
+                    continue
+            row = self.prepare_row(table, incoming)
+            stored.append(row)
+            written.append(row)
+        return written
+
+    def dashboard(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Python version of the get_dashboard SQL function.
+        """
+        deals = {d["chat_id"]: d for d in self.tables["deals"]}
+        reads = {r["chat_id"]: r["read_at"] for r in self.tables.get("chat_reads", []) if r["user_id"] == params["p_user_id"]}
+        by_chat: Dict[str, List[Dict[str, Any]]] = {}
+        for message in self.tables["messages"]:
+            by_chat.setdefault(message["chat_id"], []).append(message)
+        rows = []
+        for chat in self.tables["chats"]:
+            deal = deals.get(chat["id"], {})
+            if params.get("p_status") is not None and deal.get("status") != params["p_status"]:
+                continue
+            messages = sorted(by_chat.get(chat["id"], []), key=lambda m: (m["created_at"], m["id"]))
+            last = messages[-1] if messages else {}
+            read_at = normalize_timestamp(reads[chat["id"]]) if chat["id"] in reads else ""
+            rows.append({
+                "chat_id": chat["id"],
+                "blogger_id": chat["blogger_id"],
+                "blogger_email": None,
+                "blogger_name": None,
+                "chat_created_at": chat["created_at"],
+                "last_message_id": last.get("id"),
+                "last_message_sender": last.get("sender"),
+                "last_message_content": last.get("content"),
+                "last_message_at": last.get("created_at"),
+                "message_count": len(messages),
+                "unread_count": sum(1 for m in messages if m["sender"] == "user" and m["created_at"] > read_at),
+                "price_usd": deal.get("price_usd"),
+                "availability": deal.get("availability"),
+                "discounts": deal.get("discounts"),
+                "deal_status": deal.get("status"),
+                "deal_updated_at": deal.get("updated_at"),
+            })
+        sort = params["p_sort"]
+        rows.sort(key=lambda r: r["chat_id"])
+        present = [r for r in rows if r[sort] is not None]
+        missing = [r for r in rows if r[sort] is None]
+        present.sort(key=lambda r: r[sort], reverse=params["p_descending"])
+        rows = present + missing
+        offset, limit = params["p_offset"], params["p_limit"]
+        return {"total": len(rows), "chats": rows[offset:offset + limit]}
+
+
+class FakeOpenAI:
+    def __init__(self, config: FakeConfig):
+        self.config = config
+        self.assistants: Dict[str, Dict[str, Any]] = {}
+        self.threads: Dict[str, List[Dict[str, Any]]] = {}
+        self.runs: Dict[str, Dict[str, Any]] = {}
+        # Prompt tokens of every assistant run, in start order
+        self.run_prompt_tokens: List[int] = []
+
+    def message(self, thread_id: str, role: str, text: str, visible_at: float = 0.0) -> Dict[str, Any]:
+        msg = {
+            "id": f"msg_{uuid.uuid4().hex}",
+            "object": "thread.message",
+            "created_at": int(time.time()),
+            "thread_id": thread_id,
+            "role": role,
+            "status": "completed",
+            "content": [{"type": "text", "text": {"value": text, "annotations": []}}],
+            "attachments": [],
+            "metadata": {},
+        }
+        self.threads.setdefault(thread_id, []).append({"visible_at": visible_at, "message": msg})
+        return msg
+
+    def reply_for(self, assistant_id: str) -> str:
+        assistant = self.assistants.get(assistant_id, {})
+        return PARSER_REPLY if assistant.get("metadata", {}).get("type") == "Parser Assistant" else MANAGER_REPLY
+
+    def prompt_tokens(self, thread_id: str, assistant_id: str, body: Dict[str, Any]) -> int:
+        """
+        Roughly what the run would be billed for: instructions plus the thread messages it gets to see
+        (the last N with a last_messages truncation strategy), a token per word.
+        """
+        messages = [m["message"] for m in self.threads.get(thread_id, [])]
+        truncation = body.get("truncation_strategy") or {}
+        if truncation.get("type") == "last_messages":
+            messages = messages[-truncation["last_messages"]:]
+        text = " ".join(m["content"][0]["text"]["value"] for m in messages)
+        instructions = f"{self.assistants.get(assistant_id, {}).get('instructions') or ''} {body.get('additional_instructions') or ''}"
+        return len(text.split()) + len(instructions.split())
+
+    def run(self, thread_id: str, assistant_id: str, status: str = "queued") -> Dict[str, Any]:
+        run = {
+            "id": f"run_{uuid.uuid4().hex}",
+            "object": "thread.run",
+            "created_at": int(time.time()),
+            "thread_id": thread_id,
+            "assistant_id": assistant_id,
+            "status": status,
+            "instructions": "",
+            "model": "fake",
+            "tools": [],
+            "parallel_tool_calls": False,
+            "metadata": {},
+        }
+        return run
+
+
+def create_fake_app(config: FakeConfig) -> FastAPI:
+    app = FastAPI()
+    db = FakeSupabase()
+    ai = FakeOpenAI(config)
+    app.state.config = config
+    app.state.db = db
+    app.state.openai = ai
+    app.state.requests = Counter()
+
+    @app.middleware("http")
+    async def latency_and_counting(request: Request, call_next):
+        service = "openai" if request.url.path.startswith("/v1/") else "supabase"
+        app.state.requests[service] += 1
+        latency = config.openai_latency if service == "openai" else config.supabase_latency
+        if latency:
+            await asyncio.sleep(latency)
+        return await call_next(request)
+
+    # ───────────────
+    # Supabase auth + PostgREST
+    # ───────────────
+    @app.get("/auth/v1/user")
+    async def get_user(request: Request):
+        token = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+        user = db.user_for_token(token)
+        if not user:
+            return JSONResponse({"code": 401, "msg": "invalid JWT"}, status_code=401)
+        return user
+
+    @app.get("/rest/v1/{table}")
+    async def select_rows(table: str, request: Request):
+        rows = apply_filters(db.tables.get(table, []), request.query_params)
+        total = len(rows)
+        offset = int(request.query_params.get("offset", 0))
+        limit = request.query_params.get("limit")
+        rows = rows[offset:offset + int(limit)] if limit is not None else rows[offset:]
+        headers = {}
+        if "count=" in request.headers.get("prefer", ""):
+            headers["content-range"] = f"{offset}-{offset + max(len(rows) - 1, 0)}/{total}"
+        if "vnd.pgrst.object" in request.headers.get("accept", ""):
+            if len(rows) != 1:
+                return JSONResponse({
+                    "code": "PGRST116",
+                    "details": f"The result contains {len(rows)} rows",
+                    "hint": None,
+                    "message": "JSON object requested, multiple (or no) rows returned"
+                }, status_code=406)
+            return JSONResponse(rows[0], headers=headers)
+        return JSONResponse(rows, headers=headers)
+
+    @app.post("/rest/v1/rpc/{function}")
+    async def call_function(function: str, request: Request):
+        if function != "get_dashboard":
+            return JSONResponse({"code": "PGRST202", "details": None, "hint": None, "message": f"Could not find the function {function}"}, status_code=404)
+        return JSONResponse(db.dashboard(await request.json()))
+
+    @app.post("/rest/v1/{table}")
+    async def insert_rows(table: str, request: Request):
+        prefer = request.headers.get("prefer", "")
+        payload = json.loads(await request.body() or b"null")
+        try:
+            rows = db.write(
+                table,
+                payload,
+                request.query_params.get("on_conflict"),
+                merge="merge-duplicates" in prefer,
+                ignore="ignore-duplicates" in prefer
+            )
+        except ValueError as e:
+            return JSONResponse({"code": "23505", "details": str(e), "hint": None, "message": str(e)}, status_code=409)
+        return JSONResponse(rows, status_code=201)
+
+    @app.patch("/rest/v1/{table}")
+    async def update_rows(table: str, request: Request):
+        patch = json.loads(await request.body())
+        rows = apply_filters(db.tables.get(table, []), request.query_params)
+        for row in rows:
+            row.update(patch)
+        return JSONResponse(rows)
+
+    # ───────────────
+    # OpenAI
+    # ───────────────
+    @app.get("/v1/assistants")
+    async def list_assistants():
+        data = list(ai.assistants.values())
+        return {"object": "list", "data": data, "has_more": False,
+                "first_id": data[0]["id"] if data else None, "last_id": data[-1]["id"] if data else None}
+
+    @app.post("/v1/assistants")
+    async def create_assistant(request: Request):
+        body = await request.json()
+        assistant = {
+            "id": f"asst_{uuid.uuid4().hex}",
+            "object": "assistant",
+            "created_at": int(time.time()),
+            "name": body.get("name"),
+            "model": body.get("model"),
+            "instructions": body.get("instructions"),
+            "tools": [],
+            "metadata": body.get("metadata") or {},
+        }
+        ai.assistants[assistant["id"]] = assistant
+        return assistant
+
+    @app.get("/v1/assistants/{assistant_id}")
+    async def retrieve_assistant(assistant_id: str):
+        if assistant_id not in ai.assistants:
+            return JSONResponse({"error": {"message": "No assistant found", "type": "invalid_request_error"}}, status_code=404)
+        return ai.assistants[assistant_id]
+
+    @app.post("/v1/threads")
+    async def create_thread():
+        thread_id = f"thread_{uuid.uuid4().hex}"
+        ai.threads[thread_id] = []
+        return {"id": thread_id, "object": "thread", "created_at": int(time.time()), "metadata": {}}
+
+    @app.post("/v1/threads/{thread_id}/messages")
+    async def create_message(thread_id: str, request: Request):
+        body = await request.json()
+        content = body.get("content")
+        text = content if isinstance(content, str) else json.dumps(content)
+        return ai.message(thread_id, body.get("role", "user"), text)
+
+    @app.get("/v1/threads/{thread_id}/messages")
+    async def list_messages(thread_id: str, request: Request):
+        limit = int(request.query_params.get("limit", 20))
+        now = time.monotonic()
+        visible = [m["message"] for m in ai.threads.get(thread_id, []) if m["visible_at"] <= now]
+        data = list(reversed(visible))[:limit]
+        return {"object": "list", "data": data, "has_more": False,
+                "first_id": data[0]["id"] if data else None, "last_id": data[-1]["id"] if data else None}
+
+    @app.get("/v1/threads/{thread_id}/runs")
+    async def list_runs(thread_id: str):
+        return {"object": "list", "data": [], "has_more": False, "first_id": None, "last_id": None}
+
+    @app.post("/v1/threads/{thread_id}/runs")
+    async def create_run(thread_id: str, request: Request):
+        body = await request.json()
+        assistant_id = body["assistant_id"]
+        text = ai.reply_for(assistant_id)
+        prompt_tokens = ai.prompt_tokens(thread_id, assistant_id, body)
+        ai.run_prompt_tokens.append(prompt_tokens)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(text.split()), "total_tokens": prompt_tokens + len(text.split())}
+        if not body.get("stream"):
+            run = ai.run(thread_id, assistant_id)
+            done_at = time.monotonic() + config.run_latency
+            ai.runs[run["id"]] = {"run": run, "done_at": done_at, "usage": usage}
+            ai.message(thread_id, "assistant", text, visible_at=done_at)
+            return run
+        return StreamingResponse(stream_run(thread_id, assistant_id, text, usage), media_type="text/event-stream")
+
+    async def stream_run(thread_id: str, assistant_id: str, text: str, usage: Dict[str, int]):
+        def sse(event: str, data: Any) -> bytes:
+            return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+
+        run = ai.run(thread_id, assistant_id, status="in_progress")
+        yield sse("thread.run.created", run)
+        message = ai.message(thread_id, "assistant", text)
+        chunks = max(config.stream_chunks, 1)
+        size = max(len(text) // chunks, 1)
+        delay = config.run_latency / chunks
+        for start in range(0, len(text), size):
+            await asyncio.sleep(delay)
+            yield sse("thread.message.delta", {
+                "id": message["id"],
+                "object": "thread.message.delta",
+                "delta": {"content": [{"index": 0, "type": "text", "text": {"value": text[start:start + size]}}]}
+            })
+        yield sse("thread.message.completed", message)
+        yield sse("thread.run.completed", {**run, "status": "completed", "usage": usage})
+        yield b"event: done\ndata: [DONE]\n\n"
+
+    @app.get("/v1/threads/{thread_id}/runs/{run_id}")
+    async def retrieve_run(thread_id: str, run_id: str):
+        entry = ai.runs[run_id]
+        if time.monotonic() < entry["done_at"]:
+            return {**entry["run"], "status": "in_progress"}
+        return {**entry["run"], "status": "completed", "usage": entry["usage"]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completion(request: Request):
+        body = await request.json()
+        await asyncio.sleep(config.run_latency)
+        prompt = " ".join(str(m.get("content")) for m in body.get("messages", []))
+        if "running summary" in prompt:
+            content = SUMMARY_REPLY
+        else:
+            content = PARSER_REPLY.removeprefix("```json").removesuffix("```").strip()
+        return {
+            "id": f"chatcmpl_{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "fake",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {
+                "prompt_tokens": len(prompt.split()),
+                "completion_tokens": len(content.split()),
+                "total_tokens": len(prompt.split()) + len(content.split())
+            },
+        }
+
+    @app.api_route("/{path:path}", methods=["GET", "POST", "PATCH", "DELETE", "HEAD"])
+    async def not_found(path: str):
+        return Response(status_code=404)
+
+    return app
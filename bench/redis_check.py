@@ -0,0 +1,74 @@
+"""
+Checks RedisBus against a real Redis instance (REDIS_URL, default redis://localhost:6379/0).
+
+    docker run --rm -p 6379:6379 redis:7
+    PYTHONPATH=./src python bench/redis_check.py
+
+Two buses stand in for two workers: a frame published by one has to reach the other and must not
+come back to the publisher. Exits with status 1 when it does not.
+"""
+import argparse
+import asyncio
+import sys
+import uuid
+
+from services.broadcast import REDIS_URL, RedisBus
+
+
+async def main(args) -> int:
+    channel = f"bloggers-crm:check:{uuid.uuid4().hex}"
+    first, second = RedisBus(args.url, channel), RedisBus(args.url, channel)
+    received = {"first": asyncio.Queue(), "second": asyncio.Queue()}
+
+    def collect(name):
+        async def handler(role: str, message: str):
+            await received[name].put((role, message))
+        return handler
+
+    try:
+        try:
+            await first.client.ping()
+        except Exception as e:
+            print(f"FAIL: cannot reach Redis at {args.url}: {e}")
+            return 1
+        await first.start(collect("first"))
+        await second.start(collect("second"))
+        # Subscriptions are made by the listener tasks, wait until both are in place
+        for _ in range(50):
+            counts = await first.client.pubsub_numsub(channel)
+            if counts and counts[0][1] >= 2:
+                break
+            await asyncio.sleep(0.1)
+        else:
+            print(f"FAIL: listeners did not subscribe to {channel}")
+            return 1
+
+        await first.publish("marketer", '{"type": "deal_update"}')
+        try:
+            role, message = await asyncio.wait_for(received["second"].get(), args.timeout)
+        except asyncio.TimeoutError:
+            print("FAIL: the other bus did not receive the frame")
+            return 1
+        if (role, message) != ("marketer", '{"type": "deal_update"}'):
+            print(f"FAIL: unexpected frame {role!r} {message!r}")
+            return 1
+        await asyncio.sleep(0.2)
+        if not received["first"].empty():
+            print("FAIL: the publisher received its own frame")
+            return 1
+        print(f"OK: RedisBus delivers between workers on {args.url}")
+        return 0
+    finally:
+        await first.close()
+        await second.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=REDIS_URL, help="Redis instance to check against")
+    parser.add_argument("--timeout", type=float, default=5.0, help="Seconds to wait for the frame")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
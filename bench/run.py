@@ -0,0 +1,261 @@
+"""
+WebSocket load test for main.app against the local OpenAI/Supabase fakes in bench/fakes.py.
+
+    PYTHONPATH=./src python bench/run.py --bloggers 50 --marketers 10 --messages 5
+
+Everything (fakes, app, clients) runs in one process and one event loop, so absolute numbers
+are only comparable between runs on the same machine; use it to spot regressions.
+Exits with status 1 when an --assert-p95 limit is exceeded.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import uvicorn
+import websockets
+
+from fakes import FakeConfig, create_fake_app
+from services import wire
+
+
+class Recorder:
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def add(self, frame_type: str, seconds: float):
+        self.samples[frame_type].append(seconds * 1000)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {
+            frame_type: {
+                "count": len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "max": max(values),
+            }
+            for frame_type, values in sorted(self.samples.items())
+            if values
+        }
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+async def start_server(app, port: int = 0) -> uvicorn.Server:
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on", ws_max_size=16 * 1024 * 1024)
+    server = uvicorn.Server(config)
+    server.install_signal_handlers = lambda: None
+    server.serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server
+
+
+def server_port(server: uvicorn.Server) -> int:
+    return server.servers[0].sockets[0].getsockname()[1]
+
+
+async def receive_until(ws, predicate, timeout: float) -> dict:
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("No matching frame")
+        frame = wire.decode(await asyncio.wait_for(ws.recv(), timeout=remaining))
+        if predicate(frame):
+            return frame
+
+
+async def blogger(url: str, n: int, messages: int, recorder: Recorder, timeout: float, auth: dict):
+    async with websockets.connect(url, max_size=None) as ws:
+        start = time.monotonic()
+        await ws.send(json.dumps({"access_token": f"bench:blogger:{n}", **auth}))
+        await ws.send(json.dumps({"type": "get_existing_messages", "limit": 20}))
+        await receive_until(ws, lambda f: f.get("type") == "messages_page", timeout)
+        recorder.add("connect", time.monotonic() - start)
+
+        for i in range(messages):
+            start = time.monotonic()
+            await ws.send(json.dumps({"type": "get_existing_messages", "direction": "before", "limit": 20}))
+            await receive_until(ws, lambda f: f.get("type") == "messages_page", timeout)
+            recorder.add("get_existing_messages", time.monotonic() - start)
+
+            start = time.monotonic()
+            await ws.send(json.dumps({"type": "chat_message", "content": f"My price is $500 for a post, message {i}"}))
+            first_delta = None
+            while True:
+                frame = await receive_until(
+                    ws, lambda f: f.get("type") in ("chat_message", "chat_message_delta", "busy") or "error" in f, timeout
+                )
+                if frame["type"] == "busy":
+                    recorder.errors["chat_message_busy"] += 1
+                    break
+                if "error" in frame:
+                    recorder.errors["chat_message"] += 1
+                    break
+                if frame["type"] == "chat_message_delta" and first_delta is None:
+                    first_delta = time.monotonic() - start
+                if frame["type"] == "chat_message" and frame.get("sender") == "manager":
+                    recorder.add("chat_message", time.monotonic() - start)
+                    if first_delta is not None:
+                        recorder.add("chat_message_first_delta", first_delta)
+                    break
+
+
+async def marketer(url: str, n: int, requests: int, recorder: Recorder, timeout: float, stop: asyncio.Event, auth: dict):
+    async with websockets.connect(url, max_size=None) as ws:
+        await ws.send(json.dumps({"access_token": f"bench:marketer:{n}", **auth}))
+        cursor: Optional[str] = None
+        done = 0
+        while done < requests or not stop.is_set():
+            start = time.monotonic()
+            if done % 5 == 0:
+                await ws.send(json.dumps({"type": "get_dashboard", "limit": 100}))
+                await receive_until(ws, lambda f: f.get("type") == "dashboard", timeout)
+                recorder.add("get_dashboard", time.monotonic() - start)
+                start = time.monotonic()
+            request = {"type": "get_deals"}
+            # Alternate between full loads and delta syncs
+            if cursor and done % 2:
+                request["since"] = cursor
+            await ws.send(json.dumps(request))
+            frame = await receive_until(ws, lambda f: f.get("type") == "deals_list", timeout)
+            recorder.add("get_deals", time.monotonic() - start)
+            cursor = frame.get("cursor") or cursor
+            done += 1
+            await asyncio.sleep(0.2)
+
+
+async def main(args) -> int:
+    fake_config = FakeConfig(
+        openai_latency=args.openai_latency,
+        supabase_latency=args.supabase_latency,
+        run_latency=args.run_latency,
+        stream_chunks=args.stream_chunks
+    )
+    fake_app = create_fake_app(fake_config)
+    fake_server = await start_server(fake_app)
+    fake_url = f"http://127.0.0.1:{server_port(fake_server)}"
+
+    # The app reads its configuration at import time
+    os.environ.update({
+        "SUPABASE_URL": fake_url,
+        "SUPABASE_KEY": "bench.bench.bench",
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"{fake_url}/v1",
+        "AUTH_MODE": "remote",
+        "ASSISTANT_ID_STORE": "",
+        "MESSAGE_SPOOL_PATH": "",
+    })
+    from services import env
+    env.load_env(dotenv_path=os.devnull)
+    import main as app_main
+    from services import websocket as ws_service
+
+    app_server = await start_server(app_main.app)
+    url = f"ws://127.0.0.1:{server_port(app_server)}/ws"
+    recorder = Recorder()
+    requests_before = dict(fake_app.state.requests)
+
+    started = time.monotonic()
+    stop = asyncio.Event()
+    auth = {"encoding": args.encoding, "compression": args.compression}
+    marketers = [
+        asyncio.create_task(marketer(url, n, args.deals_requests, recorder, args.timeout, stop, auth))
+        for n in range(args.marketers)
+    ]
+    results = await asyncio.gather(
+        *(blogger(url, n, args.messages, recorder, args.timeout, auth) for n in range(args.bloggers)),
+        return_exceptions=True
+    )
+    # Let background parser work finish so it is counted in the round trips
+    while ws_service.chat_tasks.active():
+        await asyncio.sleep(0.05)
+    await ws_service.deal_updates.close()
+    stop.set()
+    results += await asyncio.gather(*marketers, return_exceptions=True)
+    elapsed = time.monotonic() - started
+
+    failures = [r for r in results if isinstance(r, Exception)]
+    chat_messages = len(recorder.samples.get("chat_message", []))
+    requests_after = fake_app.state.requests
+    round_trips = {
+        service: (requests_after[service] - requests_before.get(service, 0)) / max(chat_messages, 1)
+        for service in ("openai", "supabase")
+    }
+    run_tokens = fake_app.state.openai.run_prompt_tokens
+    report = {
+        "config": vars(args),
+        "elapsed_s": elapsed,
+        "frames": recorder.summary(),
+        "errors": dict(recorder.errors),
+        "client_failures": [repr(f) for f in failures],
+        "round_trips_per_chat_message": round_trips,
+        "run_prompt_tokens": {
+            "mean": sum(run_tokens) / max(len(run_tokens), 1),
+            "max": max(run_tokens, default=0),
+        },
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+    print(f"{'frame':<28}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for frame_type, stats in report["frames"].items():
+        print(f"{frame_type:<28}{stats['count']:>7}{stats['p50']:>10.1f}{stats['p95']:>10.1f}{stats['p99']:>10.1f}{stats['max']:>10.1f}")
+    print(f"round trips per chat_message: openai={round_trips['openai']:.2f} supabase={round_trips['supabase']:.2f}")
+    print(f"prompt tokens per run: mean={report['run_prompt_tokens']['mean']:.0f} max={report['run_prompt_tokens']['max']}")
+    print(f"peak RSS: {report['peak_rss_mb']:.1f} MB, elapsed: {elapsed:.1f}s, client failures: {len(failures)}")
+    for failure in failures[:5]:
+        print(f"  {failure!r}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    # The app shuts down first so its lifespan can still flush to the fakes
+    app_server.should_exit = True
+    await app_server.serve_task
+    fake_server.should_exit = True
+    await fake_server.serve_task
+
+    status = 1 if failures else 0
+    for limit in args.assert_p95:
+        frame_type, _, value = limit.partition("=")
+        p95 = report["frames"].get(frame_type, {}).get("p95")
+        if p95 is None or p95 > float(value):
+            print(f"FAIL: {frame_type} p95 {p95} ms exceeds {value} ms")
+            status = 1
+    return status
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bloggers", type=int, default=20)
+    parser.add_argument("--marketers", type=int, default=5)
+    parser.add_argument("--messages", type=int, default=3, help="chat messages per blogger")
+    parser.add_argument("--deals-requests", type=int, default=5, help="minimum get_deals requests per marketer")
+    parser.add_argument("--openai-latency", type=float, default=0.05, help="seconds added to every OpenAI request")
+    parser.add_argument("--supabase-latency", type=float, default=0.01, help="seconds added to every Supabase request")
+    parser.add_argument("--run-latency", type=float, default=0.5, help="seconds an assistant run takes")
+    parser.add_argument("--stream-chunks", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--encoding", choices=("json", "msgpack"), default="json", help="wire encoding asked for in the auth frame")
+    parser.add_argument("--compression", choices=("none", "deflate"), default="none")
+    parser.add_argument("--json", help="write the full report to this file")
+    parser.add_argument("--assert-p95", action="append", default=[], metavar="FRAME=MS",
+                        help="fail when the frame's p95 latency exceeds MS, e.g. chat_message=2000")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -1,18 +1,33 @@
-from database.db_connection import supabase
+from datetime import datetime, timezone
+from database.db_connection import get_supabase
+from services.metrics import timed
 
+@timed("supabase.chats.select")
 async def get_chat(blogger_id: str) -> dict:
-    resp = await supabase.table("chats").select("*").eq("blogger_id", blogger_id).maybe_single().execute()
+    resp = await get_supabase().table("chats").select("*").eq("blogger_id", blogger_id).maybe_single().execute()
     if resp is not None and resp.data:
         return resp.data
     return None
 
+@timed("supabase.chats.insert")
 async def create_chat_with_thread(blogger_id: str, thread_id: str, parser_thread_id: str) -> dict:
     data = {
         "blogger_id": blogger_id,
         "openai_thread_id": thread_id,
         "parser_thread_id": parser_thread_id,
     }
-    insert_resp = await supabase.table("chats").insert(data).execute()
-    return insert_resp.data[0] if insert_resp is not None else None
+    # chats.blogger_id is unique: when another worker created the chat first nothing is inserted and None is returned
+    insert_resp = await get_supabase().table("chats").upsert(data, on_conflict="blogger_id", ignore_duplicates=True).execute()
+    return insert_resp.data[0] if insert_resp is not None and insert_resp.data else None
 
 
+
+@timed("supabase.chats.update")
+async def update_chat_summary(chat_id: str, summary: str, summary_cursor: str) -> dict:
+    data = {
+        "summary": summary,
+        "summary_cursor": summary_cursor,
+        "summary_updated_at": datetime.now(timezone.utc).isoformat(),
+    }
+    resp = await get_supabase().table("chats").update(data).eq("id", chat_id).execute()
+    return resp.data[0] if resp is not None and resp.data else None
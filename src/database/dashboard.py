@@ -0,0 +1,46 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+from database.db_connection import get_supabase
+from postgrest.types import ReturnMethod
+from services.metrics import timed
+
+DASHBOARD_SORT_FIELDS = (
+    "last_message_at", "chat_created_at", "message_count", "unread_count",
+    "price_usd", "deal_status", "deal_updated_at", "availability"
+)
+
+@timed("supabase.rpc.get_dashboard")
+async def get_dashboard(
+    user_id: str,
+    sort: str = "last_message_at",
+    descending: bool = True,
+    status: Optional[str] = None,
+    limit: int = 50,
+    offset: int = 0
+) -> Dict[str, Any]:
+    """
+    One page of chats with blogger, latest message, total and unread counts and deal fields,
+    computed by the get_dashboard function in a single query. Unread counts are per user_id.
+    """
+    if sort not in DASHBOARD_SORT_FIELDS:
+        raise ValueError(f"Unsupported sort field: {sort}")
+    resp = await get_supabase().rpc("get_dashboard", {
+        "p_user_id": user_id,
+        "p_sort": sort,
+        "p_descending": descending,
+        "p_status": status,
+        "p_limit": limit,
+        "p_offset": offset
+    }).execute()
+    result = resp.data or {}
+    return {"chats": result.get("chats") or [], "total": result.get("total", 0)}
+
+@timed("supabase.chat_reads.upsert")
+async def mark_chat_read(user_id: str, chat_id: str) -> str:
+    read_at = datetime.now(timezone.utc).isoformat()
+    await get_supabase().table("chat_reads").upsert(
+        {"user_id": user_id, "chat_id": chat_id, "read_at": read_at},
+        on_conflict="user_id,chat_id",
+        returning=ReturnMethod.minimal
+    ).execute()
+    return read_at
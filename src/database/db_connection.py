@@ -1,7 +1,53 @@
+from typing import Optional
+from postgrest.exceptions import APIError
 from supabase import AsyncClient
 from services.env import get_env_var
+from services.http_pool import HttpPool
 
-url: str = get_env_var("SUPABASE_URL", "")
-key: str = get_env_var("SUPABASE_KEY", "")
+_supabase: Optional[AsyncClient] = None
+_pool: Optional[HttpPool] = None
 
-supabase: AsyncClient = AsyncClient(url, key)
+# SQLSTATE classes and codes PostgREST answers with a 4xx: the request itself is wrong (bad data,
+# constraint violation, unknown column or function), sending it again gives the same answer
+_PERMANENT_CODES = ("0L", "0P", "22", "23", "28", "42", "P0001", "PGRST1")
+
+def get_supabase() -> AsyncClient:
+    if _supabase is None:
+        raise RuntimeError("Supabase client is not open, open_supabase() runs in the app lifespan")
+    return _supabase
+
+def is_permanent_error(error: BaseException) -> bool:
+    """
+    True when PostgREST rejected the request for good. Connection problems and 5xx answers
+    (server overloaded, deadlock, statement timeout) may go away and are worth a retry.
+    """
+    if not isinstance(error, APIError):
+        return False
+    code = error.code
+    if isinstance(code, int) or (isinstance(code, str) and code.isdigit() and len(code) == 3):
+        # No JSON error body, only the HTTP status
+        status = int(code)
+        return 400 <= status < 500 and status not in (408, 429)
+    return bool(code) and code.startswith(_PERMANENT_CODES) and code != "42P17"
+
+async def open_supabase():
+    """
+    Create the Supabase client with PostgREST and auth requests going through one shared, pre-warmed pool.
+    """
+    global _supabase, _pool
+    url, key = get_env_var("SUPABASE_URL", ""), get_env_var("SUPABASE_KEY", "")
+    client = AsyncClient(url, key)
+    pool = HttpPool("supabase")
+    postgrest = client.postgrest
+    await postgrest.session.aclose()
+    postgrest.session = pool.client(base_url=postgrest.base_url, headers=postgrest.headers)
+    await client.auth._http_client.aclose()
+    client.auth._http_client = pool.client()
+    await pool.prewarm(f"{url}/auth/v1/health", headers={"apikey": key})
+    _supabase, _pool = client, pool
+
+async def close_supabase():
+    global _supabase, _pool
+    if _pool is not None:
+        await _pool.close()
+    _supabase, _pool = None, None
@@ -1,24 +1,28 @@
-from database.db_connection import supabase
+from database.db_connection import get_supabase
+from services.metrics import timed
 from schemas import DealData
 
+@timed("supabase.deals.upsert")
 async def update_deal(deal_data: DealData):
+    # Single round trip: insert or patch the chat's deal, only the fields that were extracted are written
     data = {
         "price_usd": deal_data.price_usd,
         "availability": deal_data.availability,
         "discounts": deal_data.discounts,
         "status": deal_data.status,
-        "chat_id": deal_data.chat_id
     }
-    deal = await supabase.table("deals").select("*").eq("chat_id", deal_data.chat_id).maybe_single().execute()
-
-    response = None
-    if not deal:
-        response = await supabase.table("deals").insert(data).execute()
-    else:
-        patched_data = {k: v for k, v in data.items() if v is not None}
-        response = await supabase.table("deals").update(patched_data).eq("id", deal.data["id"]).execute()
+    patched_data = {k: v for k, v in data.items() if v is not None}
+    patched_data["chat_id"] = deal_data.chat_id
+    response = await get_supabase().table("deals").upsert(patched_data, on_conflict="chat_id").execute()
     return response
 
+@timed("supabase.deals.select")
 async def get_all_deals():
-    deals_resp = await supabase.table("deals").select("*").execute()
+    deals_resp = await get_supabase().table("deals").select("*").execute()
+    return deals_resp.data if deals_resp.data else []
+
+@timed("supabase.deals.select_since")
+async def get_deals_updated_since(updated_at: str):
+    # Inclusive: callers pass their cursor minus an overlap and de-duplicate by chat_id
+    deals_resp = await get_supabase().table("deals").select("*").gte("updated_at", updated_at).execute()
     return deals_resp.data if deals_resp.data else []
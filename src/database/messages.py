@@ -1,31 +1,94 @@
-from schemas import MessageIn
-from database.db_connection import supabase
-from typing import Dict, Any, List
+from services.metrics import timed
+from database.db_connection import get_supabase
+from postgrest.types import ReturnMethod
+from typing import Dict, Any, List, Literal, Optional
+import base64
+import uuid
+from datetime import datetime
 
-async def save_message(message: MessageIn):
-    data: Dict[str, Any] = {
-        "chat_id": message.chat_id,
-        "sender": message.sender,
-        "content": message.content,
-        "openai_message_id": message.openai_message_id,
-        "created_at": message.created_at,
-    }
-    response = await supabase.table("messages").insert(data).execute()
-    return response
+CountMode = Optional[Literal["exact", "planned", "estimated"]]
+
+@timed("supabase.messages.insert_batch")
+async def insert_messages(rows: List[Dict[str, Any]]):
+    # Rows carry their own id, so a batch that is sent again (retry, spool replay) inserts nothing twice
+    return await (
+        get_supabase().table("messages")
+        .upsert(rows, on_conflict="id", ignore_duplicates=True, returning=ReturnMethod.minimal)
+        .execute()
+    )
 
-async def get_messages_page(chat_id: str, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+@timed("supabase.messages.select_page")
+async def get_messages_page(chat_id: str, limit: int = 20, offset: int = 0, count: CountMode = "exact") -> Dict[str, Any]:
+    # The count comes back in the same response (Content-Range), no second query is needed
     query = (
-        supabase.table("messages")
-        .select("*")
+        get_supabase().table("messages")
+        .select("*", count=count)
         .eq("chat_id", chat_id)
         .order("created_at", desc=False)
+        .order("id", desc=False)
         .range(offset, offset + limit - 1)
     )
     resp = await query.execute()
     messages: List[Dict[str, Any]] = resp.data if resp.data else []
-    count_resp = await supabase.table("messages").select("id", count="exact").eq("chat_id", chat_id).execute()
-    total_count = count_resp.count if hasattr(count_resp, "count") else len(messages)
     return {
         "messages": messages,
-        "total_count": total_count
+        "total_count": resp.count if count else None
+    }
+
+def encode_cursor(message: Dict[str, Any]) -> str:
+    raw = f"{message['created_at']}|{message['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    # Both parts end up in a PostgREST filter string, only a timestamp and a UUID may get there
+    try:
+        created_at, message_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(created_at).isoformat(), str(uuid.UUID(message_id))
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+@timed("supabase.messages.select_cursor")
+async def get_messages_by_cursor(
+    chat_id: str,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    direction: Literal["before", "after"] = "before",
+    count: CountMode = None
+) -> Dict[str, Any]:
+    """
+    Keyset pagination on (created_at, id), served by the (chat_id, created_at, id) index.
+    "before" walks back from the cursor (or from the newest message), "after" walks forward
+    from it (or from the oldest). Messages are always returned oldest first and next_cursor
+    continues in the same direction.
+    """
+    if direction not in ("before", "after"):
+        raise ValueError(f"Unknown direction: {direction}")
+    backward = direction == "before"
+    query = get_supabase().table("messages").select("*", count=count).eq("chat_id", chat_id)
+    if cursor:
+        created_at, message_id = decode_cursor(cursor)
+        op = "lt" if backward else "gt"
+        query = query.or_(
+            f'created_at.{op}."{created_at}",and(created_at.eq."{created_at}",id.{op}.{message_id})'
+        )
+    query = query.order("created_at", desc=backward).order("id", desc=backward).limit(limit + 1)
+    resp = await query.execute()
+    rows: List[Dict[str, Any]] = resp.data if resp.data else []
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        rows.reverse()
+    next_cursor = None
+    if has_more and rows:
+        next_cursor = encode_cursor(rows[0] if backward else rows[-1])
+    return {
+        "messages": rows,
+        "has_more": has_more,
+        "next_cursor": next_cursor,
+        "total_count": resp.count if count else None
     }
+
+@timed("supabase.messages.exists")
+async def has_messages(chat_id: str) -> bool:
+    resp = await get_supabase().table("messages").select("id").eq("chat_id", chat_id).limit(1).execute()
+    return bool(resp.data)
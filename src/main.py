@@ -1,9 +1,26 @@
 from services.env import load_env
 load_env()
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from services.websocket import router
+from services.websocket import router, start_websocket_services, shutdown_websocket_services
+from services.llm import assistant_cache, open_openai_client, close_openai_client
+from database.db_connection import open_supabase, close_supabase
+from services.metrics import router as metrics_router
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Clients and their connection pools live exactly as long as the app
+    await open_supabase()
+    await open_openai_client()
+    await assistant_cache.warm()
+    await start_websocket_services()
+    yield
+    await shutdown_websocket_services()
+    await close_openai_client()
+    await close_supabase()
 
-app.include_router(router)
\ No newline at end of file
+app = FastAPI(lifespan=lifespan)
+
+app.include_router(router)
+app.include_router(metrics_router)
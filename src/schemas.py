@@ -1,7 +1,8 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Dict, Any
 
 class MessageIn(BaseModel):
+    id: Optional[str] = None
     chat_id: str
     sender: str
     content: str
@@ -16,9 +17,16 @@ class MessageOut(BaseModel):
     content: str
     created_at: str
 
-class DealData(BaseModel):
-    chat_id: str
+class DealFields(BaseModel):
     price_usd: Optional[float] = None
     availability: Optional[str] = None
     discounts: Optional[str] = None
     status: Optional[str] = None
+
+class DealData(DealFields):
+    chat_id: str
+
+class AuthUser(BaseModel):
+    id: str
+    email: Optional[str] = None
+    user_metadata: Dict[str, Any] = {}
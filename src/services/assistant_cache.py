@@ -1,6 +1,17 @@
+import asyncio
+import hashlib
+import json
+import logging
 import os
-from typing import Dict, Any, Optional, List
+from functools import lru_cache
+from typing import Callable, Dict, Any, Optional, List
 import openai
+from services.env import get_env_var
+
+logger = logging.getLogger(__name__)
+
+# Assistant ids resolved by previous runs, keyed by name, version and config hash
+ASSISTANT_ID_STORE = get_env_var("ASSISTANT_ID_STORE", ".assistant_ids.json")
 
 def get_prompt_from_file(filename: str) -> str:
     path = os.path.join(os.path.dirname(__file__), "../../assistants", filename)
@@ -24,61 +35,142 @@ PresaleAssistants = {
     },
 }
 
+@lru_cache(maxsize=None)
+def get_config_hash(assistant_name: str) -> str:
+    """
+    Fingerprint of an assistant's configuration including its prompt file,
+    so any prompt or parameter change resolves to a new assistant.
+    """
+    config = PresaleAssistants[assistant_name]
+    payload = {k: v for k, v in config.items() if not callable(v)}
+    payload["instructions"] = config["getAssistantInstruction"]()
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16]
+
 class AssistantCache:
-    def __init__(self, openai_client: openai.OpenAI):
-        self.cache: List[Dict[str, str]] = []
-        self.openai_client = openai_client
+    def __init__(self, get_client: Callable[[], openai.AsyncOpenAI], id_store_path: Optional[str] = ASSISTANT_ID_STORE):
+        self.cache: Dict[str, str] = {}
+        # The client is opened in the app lifespan, after this object is created
+        self.get_client = get_client
+        self.id_store_path = id_store_path
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._stored = self._load_store()
 
-    async def get_assistant_id(self, assistant_name: str) -> str:
+    def _load_store(self) -> Dict[str, str]:
+        if not self.id_store_path or not os.path.exists(self.id_store_path):
+            return {}
         try:
-            config = PresaleAssistants[assistant_name]
-            model = config["model"]
-            temperature = config["temperature"]
-            get_instruction = config["getAssistantInstruction"]
-            assistant_version = config["assistant_version"]
-            assistant_name_str = config["assistant_name"]
-
-            cached = next((a for a in self.cache if a["name"] == assistant_name_str and a["version"] == assistant_version), None)
-            if cached:
-                return cached["id"]
-            latest_assistant = await find_latest_assistant_by_type(self.openai_client, assistant_name_str, assistant_version)
+            with open(self.id_store_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            logger.warning("Ignoring unreadable assistant id store %s", self.id_store_path)
+            return {}
+
+    def _save_store(self):
+        if not self.id_store_path:
+            return
+        try:
+            tmp_path = f"{self.id_store_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._stored, f)
+            os.replace(tmp_path, self.id_store_path)
+        except OSError:
+            logger.warning("Could not write assistant id store %s", self.id_store_path)
+
+    def _cache_key(self, assistant_name: str) -> str:
+        config = PresaleAssistants[assistant_name]
+        return f"{config['assistant_name']}:{config['assistant_version']}:{get_config_hash(assistant_name)}"
+
+    async def warm(self, verify: bool = True):
+        """
+        Resolve every configured assistant up front (app startup).
+        Ids from the on-disk store are checked against the API once, unless verify is False.
+        """
+        names = list(PresaleAssistants)
+        results = await asyncio.gather(*(self._warm_one(name, verify) for name in names), return_exceptions=True)
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                logger.error("Failed to resolve assistant %s at startup: %s", name, result)
+
+    async def _warm_one(self, assistant_name: str, verify: bool):
+        key = self._cache_key(assistant_name)
+        stored_id = self._stored.get(key)
+        if stored_id and verify:
+            try:
+                await self.get_client().beta.assistants.retrieve(stored_id)
+            except openai.NotFoundError:
+                self._stored.pop(key, None)
+        await self.get_assistant_id(assistant_name)
+
+    async def get_assistant_id(self, assistant_name: str) -> str:
+        if assistant_name not in PresaleAssistants:
+            raise ValueError(f"Assistant {assistant_name} not found in configuration")
+        cached = self.cache.get(assistant_name)
+        if cached:
+            return cached
+        # Single flight: concurrent callers on a cold process share one lookup/creation
+        task = self._inflight.get(assistant_name)
+        if task is None:
+            task = self._inflight[assistant_name] = asyncio.create_task(self._resolve(assistant_name))
+            task.add_done_callback(lambda _: self._inflight.pop(assistant_name, None))
+        return await asyncio.shield(task)
+
+    async def _resolve(self, assistant_name: str) -> str:
+        config = PresaleAssistants[assistant_name]
+        assistant_version = config["assistant_version"]
+        assistant_name_str = config["assistant_name"]
+        config_hash = get_config_hash(assistant_name)
+        key = self._cache_key(assistant_name)
+
+        assistant_id = self._stored.get(key)
+        if not assistant_id:
+            latest_assistant = await find_latest_assistant_by_type(
+                self.get_client(), assistant_name_str, assistant_version, config_hash
+            )
             if not latest_assistant:
                 latest_assistant = await create_assistant_with_metadata(
-                    self.openai_client,
+                    self.get_client(),
                     f"{assistant_name_str} v{assistant_version}",
-                    get_instruction(),
-                    temperature,
-                    model,
+                    config["getAssistantInstruction"](),
+                    config["temperature"],
+                    config["model"],
                     {
                         "type": assistant_name_str,
-                        "version": assistant_version
+                        "version": assistant_version,
+                        "config_hash": config_hash
                     }
                 )
-            self.cache.append({
-                "id": latest_assistant.id,
-                "name": assistant_name_str,
-                "version": assistant_version
-            })
-            return latest_assistant.id
-        except KeyError:
-            raise ValueError(f"Assistant {assistant_name} not found in configuration")
+            assistant_id = latest_assistant.id
+            self._stored[key] = assistant_id
+            self._save_store()
+        self.cache[assistant_name] = assistant_id
+        return assistant_id
 
-async def list_assistants(openai_client: openai.OpenAI, limit: int = 20, order: str = "desc") -> List[Any]:
-    response = await openai_client.beta.assistants.list(order=order, limit=limit)
-    return response.data
+async def list_assistants(openai_client: openai.AsyncOpenAI, limit: int = 100, order: str = "desc") -> List[Any]:
+    # Walks every page, not just the newest `limit` assistants
+    assistants = []
+    async for assistant in openai_client.beta.assistants.list(order=order, limit=limit):
+        assistants.append(assistant)
+    return assistants
 
-async def find_latest_assistant_by_type(openai_client: openai.OpenAI, type_: str, version: Optional[str] = None) -> Optional[Any]:
+async def find_latest_assistant_by_type(
+    openai_client: openai.AsyncOpenAI,
+    type_: str,
+    version: Optional[str] = None,
+    config_hash: Optional[str] = None
+) -> Optional[Any]:
     assistants = await list_assistants(openai_client)
     filtered = [
         a for a in assistants
-        if (a.metadata.get("type") == type_ and (version is None or a.metadata.get("version") == version))
+        if (a.metadata.get("type") == type_
+            and (version is None or a.metadata.get("version") == version)
+            and (config_hash is None or a.metadata.get("config_hash") == config_hash))
     ]
     if not filtered:
         return None
     return max(filtered, key=lambda a: float(a.metadata.get("version", "0")))
 
 async def create_assistant_with_metadata(
-    openai_client: openai.OpenAI,
+    openai_client: openai.AsyncOpenAI,
     name: str,
     instructions: str,
     temperature: float,
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import logging
+import uuid
+from typing import Awaitable, Callable, Optional
+from services.env import get_env_var
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_BACKEND = get_env_var("BROADCAST_BACKEND", "memory")
+BROADCAST_CHANNEL = get_env_var("BROADCAST_CHANNEL", "bloggers-crm:broadcast")
+REDIS_URL = get_env_var("REDIS_URL", "redis://localhost:6379/0")
+
+Handler = Callable[[str, str], Awaitable[None]]
+
+
+class BroadcastBus:
+    """
+    Forwards role broadcasts between app processes.
+    Frames are always delivered locally by the ConnectionManager first; the bus only carries
+    them to the other workers/machines, which call the handler passed to start().
+    """
+    def __init__(self):
+        self.node_id = uuid.uuid4().hex
+
+    async def start(self, handler: Handler):
+        pass
+
+    async def publish(self, role: str, message: str):
+        pass
+
+    async def close(self):
+        pass
+
+
+class InProcessBus(BroadcastBus):
+    """
+    Single-process deployments: there is nobody else to forward to.
+    """
+
+
+class RedisBus(BroadcastBus):
+    """
+    Redis pub/sub transport. Needs the optional `redis` package (redis>=5).
+    """
+    def __init__(self, url: str = REDIS_URL, channel: str = BROADCAST_CHANNEL):
+        super().__init__()
+        try:
+            import redis.asyncio as aioredis
+        except ImportError:
+            raise RuntimeError("BROADCAST_BACKEND=redis requires the 'redis' package")
+        self.channel = channel
+        self.client = aioredis.from_url(url)
+        self.listener: Optional[asyncio.Task] = None
+
+    async def start(self, handler: Handler):
+        self.listener = asyncio.create_task(self._listen(handler))
+
+    async def _listen(self, handler: Handler):
+        retry_delay = 0.5
+        while True:
+            pubsub = self.client.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                retry_delay = 0.5
+                async for item in pubsub.listen():
+                    if item.get("type") != "message":
+                        continue
+                    envelope = json.loads(item["data"])
+                    if envelope.get("origin") == self.node_id:
+                        continue
+                    await handler(envelope["role"], envelope["message"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Broadcast subscription failed, reconnecting in %.1fs", retry_delay)
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 30)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    async def publish(self, role: str, message: str):
+        envelope = json.dumps({"origin": self.node_id, "role": role, "message": message})
+        await self.client.publish(self.channel, envelope)
+
+    async def close(self):
+        if self.listener:
+            self.listener.cancel()
+            await asyncio.gather(self.listener, return_exceptions=True)
+        await self.client.aclose()
+
+
+def create_broadcast_bus(backend: str = BROADCAST_BACKEND) -> BroadcastBus:
+    if backend == "memory":
+        return InProcessBus()
+    if backend == "redis":
+        return RedisBus()
+    raise ValueError(f"Unknown broadcast backend: {backend}")
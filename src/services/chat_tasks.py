@@ -0,0 +1,92 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+from services.metrics import untraced_task
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[None]]
+ErrorHandler = Callable[[str, BaseException], Awaitable[None]]
+
+
+class ChatTaskQueue:
+    """
+    Runs background jobs (parser extraction, deal updates) off the request path.
+    Jobs for the same chat run one at a time in submission order, different chats run concurrently.
+    """
+    def __init__(self, on_error: Optional[ErrorHandler] = None):
+        self.on_error = on_error
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+
+    def submit(self, chat_id: str, job: Job):
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = asyncio.Queue()
+        queue.put_nowait(job)
+        if chat_id not in self._workers:
+            self._workers[chat_id] = untraced_task(self._run_worker(chat_id, queue))
+
+    def active(self) -> int:
+        """
+        Number of chats with queued or running jobs.
+        """
+        return len(self._workers)
+
+    def pending(self, chat_id: str) -> int:
+        queue = self._queues.get(chat_id)
+        return queue.qsize() if queue is not None else 0
+
+    async def _run_worker(self, chat_id: str, queue: asyncio.Queue):
+        try:
+            # The worker exits as soon as the queue is empty; submit() starts a new one on demand
+            while not queue.empty():
+                job = queue.get_nowait()
+                try:
+                    await job()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.exception("Background job failed for chat %s", chat_id)
+                    await self._report_error(chat_id, e)
+        finally:
+            self._workers.pop(chat_id, None)
+            self._queues.pop(chat_id, None)
+
+    async def _report_error(self, chat_id: str, error: BaseException):
+        if not self.on_error:
+            return
+        try:
+            await self.on_error(chat_id, error)
+        except Exception:
+            logger.exception("Failed to report background job error for chat %s", chat_id)
+
+    async def drain(self, chat_id: str, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every job queued for the chat has finished. Returns False on timeout.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout is not None else None
+        while chat_id in self._workers:
+            worker = self._workers[chat_id]
+            remaining = deadline - loop.time() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                return False
+            done, _ = await asyncio.wait({worker}, timeout=remaining)
+            if not done:
+                return False
+        return True
+
+    async def shutdown(self, timeout: Optional[float] = None):
+        """
+        Let queued jobs finish within the timeout, then cancel whatever is still running.
+        """
+        workers = list(self._workers.values())
+        if not workers:
+            return
+        _, pending = await asyncio.wait(workers, timeout=timeout)
+        for task in pending:
+            logger.warning("Cancelling background jobs still running at shutdown")
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
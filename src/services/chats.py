@@ -1,40 +1,125 @@
 from schemas import MessageIn
 from database.chats import create_chat_with_thread, get_chat
-from database.messages import get_messages_page, save_message
+from database.messages import has_messages
 from services.llm import create_openai_thread, send_welcome_text_to_thread
+from services.cache import TTLCache
+from services.message_writer import message_writer
+from services.env import get_env_var
+from services.thread_pool import ThreadPool
 from datetime import datetime
+from typing import Dict, Optional, Tuple
+import asyncio
+import uuid
+
+# Chat rows are resolved once and reused; the only later change (the summary) is pushed to every worker, see compact_chat
+chat_cache: TTLCache[dict] = TTLCache(
+    maxsize=int(get_env_var("CHAT_CACHE_SIZE", "10000")),
+    ttl=float(get_env_var("CHAT_CACHE_TTL", "300"))
+)
 
 welcome_text = (
         "Hi! I'm Robert from InfluenceCRM 😊 Thanks for connecting. "
         "Could you tell me how much you charge for a brand integration?"
 )
 
-async def create_welcome_message(chat_id: str, thread_id: str):
-    message_in_thread = await send_welcome_text_to_thread(welcome_text, thread_id)
-    await save_message(
+# Thread pairs for new bloggers, pre-created (welcome included unless THREAD_POOL_WELCOME is off) in the background
+thread_pool = ThreadPool(
+    create_openai_thread,
+    post_welcome=(
+        (lambda thread_id: send_welcome_text_to_thread(welcome_text, thread_id))
+        if get_env_var("THREAD_POOL_WELCOME", "true").lower() in ("1", "true", "yes") else None
+    ),
+    size=int(get_env_var("THREAD_POOL_SIZE", "8")),
+    prefill=int(get_env_var("THREAD_POOL_PREFILL", "0"))
+)
+
+# Onboardings in progress by blogger_id, simultaneous first connects share one
+_onboarding: Dict[str, asyncio.Task] = {}
+
+def save_welcome_message(chat_id: str, openai_message_id: str):
+    message_writer.submit(
         MessageIn(
+            # One welcome row per chat: a second one written by another worker is ignored as a duplicate
+            id=str(uuid.uuid5(uuid.NAMESPACE_URL, f"welcome:{chat_id}")),
             chat_id=chat_id,
             sender="manager",
             content=welcome_text,
-            openai_message_id=message_in_thread.id,
+            openai_message_id=openai_message_id,
             created_at=datetime.utcnow().isoformat()
         )
     )
 
-async def get_or_create_chat_with_thread(blogger_id: str):
-    chat = await get_chat(blogger_id)
-    if not chat:
-        thread_id = await create_openai_thread()
-        parser_thread_id = await create_openai_thread()
-        chat = await create_chat_with_thread(blogger_id, thread_id, parser_thread_id)
+async def create_welcome_message(chat_id: str, thread_id: str):
+    message_in_thread = await send_welcome_text_to_thread(welcome_text, thread_id)
+    save_welcome_message(chat_id, message_in_thread.id)
+
+async def get_cached_chat(blogger_id: str) -> Optional[dict]:
+    chat = chat_cache.get(blogger_id)
+    if chat is None:
+        chat = await get_chat(blogger_id)
+        if chat:
+            chat_cache.set(blogger_id, chat)
+    return chat
+
+def invalidate_chat(blogger_id: str):
+    chat_cache.invalidate(blogger_id)
+
+async def get_or_create_chat_with_thread(blogger_id: str) -> Tuple[dict, bool]:
+    """
+    Returns the blogger's chat and whether it was onboarded just now, in which case the worker
+    that created it has already queued the welcome message.
+    """
+    chat = await get_cached_chat(blogger_id)
+    if chat:
+        return chat, False
+    task = _onboarding.get(blogger_id)
+    if task is None:
+        task = _onboarding[blogger_id] = asyncio.create_task(onboard_blogger(blogger_id))
+        task.add_done_callback(lambda _: _onboarding.pop(blogger_id, None))
+    return await asyncio.shield(task), True
+
+async def onboard_blogger(blogger_id: str) -> dict:
+    """
+    Create the blogger's chat on a claimed thread pair and queue its welcome message.
+    Posting the welcome (when the pair has none yet) runs alongside the chat insert.
+    """
+    pair = await thread_pool.acquire()
+    welcome = None
+    if pair.welcome_message_id is None:
+        welcome = asyncio.create_task(send_welcome_text_to_thread(welcome_text, pair.thread_id))
+    try:
+        chat = await create_chat_with_thread(blogger_id, pair.thread_id, pair.parser_thread_id)
+    except Exception:
+        # No chat uses the threads, keep them (with the welcome once it is posted) for the next blogger
+        if welcome is not None:
+            posted, = await asyncio.gather(welcome, return_exceptions=True)
+            if not isinstance(posted, BaseException):
+                pair.welcome_message_id = posted.id
+        thread_pool.give_back(pair)
+        raise
+    except BaseException:
+        if welcome is not None:
+            welcome.cancel()
+        raise
+    if welcome is not None:
+        pair.welcome_message_id = (await welcome).id
+    if chat is None:
+        # Another worker created the chat first, its threads are the ones in use and it queues the welcome
+        thread_pool.give_back(pair)
+        chat = await get_chat(blogger_id)
+    else:
+        save_welcome_message(chat["id"], pair.welcome_message_id)
+    if chat:
+        chat_cache.set(blogger_id, chat)
     return chat
 
 async def send_welcome_message_if_needed(blogger_id):
     if not blogger_id:
         raise ValueError("blogger_id is required to create or get chat")
-    chat = await get_or_create_chat_with_thread(blogger_id)
+    chat, onboarded = await get_or_create_chat_with_thread(blogger_id)
     chat_id = chat["id"]
     thread_id = chat.get("openai_thread_id")
-    page = await get_messages_page(chat_id, limit=1, offset=0)
-    if page["total_count"] == 0:
+    # The welcome message of a quick reconnect may still be waiting in the writer
+    if not onboarded and not message_writer.pending(chat_id) and not await has_messages(chat_id):
         await create_welcome_message(chat_id, thread_id)
+    return chat
@@ -0,0 +1,101 @@
+import json
+import logging
+from typing import Any, Dict, List, Optional
+from database.chats import update_chat_summary
+from database.messages import encode_cursor, get_messages_by_cursor
+from services.env import get_env_var
+from services.metrics import registry
+from services.llm import COMPACTION_THRESHOLD, CONVERSATION_WINDOW, summarize_conversation
+
+logger = logging.getLogger(__name__)
+
+DEAL_FIELDS = ("price_usd", "availability", "discounts", "status")
+
+
+def run_context(chat: dict, deal: Optional[Dict[str, Any]]) -> Optional[str]:
+    """
+    Additional instructions for a run on the chat: the summary of the turns outside the
+    recent-message window and the current deal row.
+    """
+    parts = []
+    if chat.get("summary"):
+        parts.append(f"Summary of the earlier conversation:\n{chat['summary']}")
+    terms = {field: deal.get(field) for field in DEAL_FIELDS if deal and deal.get(field) is not None}
+    if terms:
+        parts.append(f"Current deal terms in the CRM:\n{json.dumps(terms, ensure_ascii=False)}")
+    return "\n\n".join(parts) or None
+
+
+def summary_prompt(summary: Optional[str], deal: Optional[Dict[str, Any]], messages: List[Dict[str, Any]]) -> str:
+    terms = {field: deal.get(field) for field in DEAL_FIELDS} if deal else {}
+    transcript = "\n".join(
+        f"{'Blogger' if m['sender'] == 'user' else 'Manager'}: {m['content']}" for m in messages
+    )
+    return (
+        f"Previous summary:\n{summary or '(none)'}\n\n"
+        f"Current deal record:\n{json.dumps(terms, ensure_ascii=False)}\n\n"
+        f"Next part of the conversation:\n{transcript}"
+    )
+
+
+class ConversationCompactor:
+    """
+    Keeps chats.summary covering every message the runs do not see. Runs see the newest
+    window + threshold messages; the messages after summary_cursor are folded into the summary
+    (one completion, the newest `window` are kept) before there are more than that.
+    Chats are checked every `check_every` turns and a turn adds at most two messages, so folding starts
+    2 * check_every messages early. threshold has to be larger than that for the headroom to work.
+    """
+    def __init__(self, window: int, threshold: int = 20, check_every: int = 5):
+        self.window = window
+        self.threshold = threshold
+        self.check_every = check_every
+        self.trigger = max(window + 1, window + threshold - 2 * check_every)
+        self.compacted = 0
+        # Turns since the last check per chat, the first turn after a restart is checked
+        self._turns: Dict[str, int] = {}
+
+    def due(self, chat_id: str) -> bool:
+        if self.window <= 0 or self.threshold <= 0:
+            return False
+        turns = self._turns.get(chat_id, 0)
+        self._turns[chat_id] = (turns + 1) % self.check_every
+        return turns == 0
+
+    async def compact(self, chat: dict, deal: Optional[Dict[str, Any]]):
+        """
+        Fold the messages older than the newest `window` into the summary, at most `threshold` per completion.
+        The chat dict is updated in place; the caller passes the change on to other holders of the chat.
+        Failures are logged, the chat is simply checked again later.
+        """
+        try:
+            while await self._fold(chat, deal):
+                pass
+        except Exception:
+            logger.exception("Failed to compact chat %s", chat.get("id"))
+
+    async def _fold(self, chat: dict, deal: Optional[Dict[str, Any]]) -> bool:
+        page = await get_messages_by_cursor(
+            chat["id"], limit=self.threshold + self.window, cursor=chat.get("summary_cursor"), direction="after"
+        )
+        messages = page["messages"]
+        if not page["has_more"] and len(messages) < self.trigger:
+            return False
+        older = messages[:-self.window]
+        summary = await summarize_conversation(summary_prompt(chat.get("summary"), deal, older))
+        if not summary:
+            return False
+        cursor = encode_cursor(older[-1])
+        await update_chat_summary(chat["id"], summary, cursor)
+        chat.update(summary=summary, summary_cursor=cursor)
+        self.compacted += 1
+        return True
+
+
+compactor = ConversationCompactor(
+    window=CONVERSATION_WINDOW,
+    threshold=COMPACTION_THRESHOLD,
+    check_every=int(get_env_var("COMPACTION_CHECK_EVERY", "5"))
+)
+
+registry.counter("bloggers_crm_chat_compactions_total", "Batches of older messages folded into chat summaries", lambda: compactor.compacted)
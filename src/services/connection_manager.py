@@ -1,28 +1,184 @@
+import asyncio
+import logging
 from fastapi import WebSocket
-from typing import Dict, List, Any
+from typing import Awaitable, Callable, Dict, List, Set, Optional, Union
+from services.env import get_env_var
+from services.broadcast import BroadcastBus, InProcessBus
+from services.wire import Frame, WireFormat, JSON, as_frame
+
+logger = logging.getLogger(__name__)
+
+SEND_QUEUE_SIZE = int(get_env_var("WS_SEND_QUEUE_SIZE", "256"))
+# What to do when a broadcast finds a connection's send queue full: "drop" the frame or "disconnect" the socket
+SLOW_CONSUMER_POLICY = get_env_var("WS_SLOW_CONSUMER_POLICY", "drop")
+
+Message = Union[Frame, dict, str]
+
+
+class Connection:
+    __slots__ = ("ws", "user_id", "role", "chat", "wire", "queue", "writer", "dropped")
+
+    def __init__(self, ws: WebSocket, queue_size: int):
+        self.ws = ws
+        self.user_id: Optional[str] = None
+        self.role: Optional[str] = None
+        # Blogger's chat row (id, openai_thread_id, parser_thread_id), resolved once at auth time
+        self.chat: Optional[dict] = None
+        # Encoding and compression negotiated in the auth frame
+        self.wire: WireFormat = JSON
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.writer: Optional[asyncio.Task] = None
+        self.dropped = 0
+
+    @property
+    def chat_id(self) -> Optional[str]:
+        return self.chat["id"] if self.chat else None
 
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[Dict[str, Any]] = []
+    """
+    Registry of open sockets indexed by websocket, user and role.
+    Every connection has its own bounded send queue drained by a writer task,
+    so a slow socket never blocks the code that sends to it or broadcasts to its role.
+    Messages are queued as Frames and encoded by the writer in the connection's wire format,
+    a broadcast frame is encoded once per format however many sockets receive it.
+    Role broadcasts are also published on the bus so sockets held by other workers receive them.
+    """
+    def __init__(
+        self,
+        queue_size: int = SEND_QUEUE_SIZE,
+        slow_consumer_policy: str = SLOW_CONSUMER_POLICY,
+        bus: Optional[BroadcastBus] = None
+    ):
+        if slow_consumer_policy not in ("drop", "disconnect"):
+            raise ValueError(f"Unknown slow consumer policy: {slow_consumer_policy}")
+        self.queue_size = queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        self.connections: Dict[WebSocket, Connection] = {}
+        self.by_user: Dict[str, Set[Connection]] = {}
+        self.by_role: Dict[str, Set[Connection]] = {}
+        self.bus = bus or InProcessBus()
+        # Called with (role, message) for every broadcast received from another worker
+        self.remote_listeners: List[Callable[[str, str], Awaitable[None]]] = []
+
+    async def start(self):
+        await self.bus.start(self._deliver_remote)
+
+    async def close(self):
+        await self.bus.close()
+
+    async def _deliver_remote(self, role: str, message: str):
+        self.broadcast_to_role(role, Frame(text=message))
+        for listener in self.remote_listeners:
+            try:
+                await listener(role, message)
+            except Exception:
+                logger.exception("Remote broadcast listener failed")
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append({"ws": websocket, "user_id": None, "role": None, "chat_id": None})
+        conn = Connection(websocket, self.queue_size)
+        conn.writer = asyncio.create_task(self._write_loop(conn))
+        self.connections[websocket] = conn
+
+    def bind_user(self, websocket: WebSocket, user_id: str, role: str, chat: Optional[dict] = None, wire: WireFormat = JSON):
+        conn = self.connections.get(websocket)
+        if conn is None:
+            return
+        self._unindex(conn)
+        conn.user_id = user_id
+        conn.role = role
+        conn.chat = chat
+        conn.wire = wire
+        self.by_user.setdefault(user_id, set()).add(conn)
+        self.by_role.setdefault(role, set()).add(conn)
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections = [conn for conn in self.active_connections if conn["ws"] != websocket]
+        conn = self.connections.pop(websocket, None)
+        if conn is None:
+            return
+        self._unindex(conn)
+        if conn.writer and conn.writer is not asyncio.current_task():
+            conn.writer.cancel()
+
+    def _unindex(self, conn: Connection):
+        for index, key in ((self.by_user, conn.user_id), (self.by_role, conn.role)):
+            if key is None:
+                continue
+            bucket = index.get(key)
+            if bucket is not None:
+                bucket.discard(conn)
+                if not bucket:
+                    del index[key]
+
+    async def _write_loop(self, conn: Connection):
+        try:
+            while True:
+                frame = await conn.queue.get()
+                data = frame.encode(conn.wire)
+                if isinstance(data, str):
+                    await conn.ws.send_text(data)
+                else:
+                    await conn.ws.send_bytes(data)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # The socket is gone; stop accepting frames for it
+            self.disconnect(conn.ws)
+
+    async def send_personal_message(self, message: Message, websocket: WebSocket):
+        conn = self.connections.get(websocket)
+        if conn is None:
+            return
+        # Waits for room in the queue, so a slow client only slows down its own handler
+        await conn.queue.put(as_frame(message))
+
+    def broadcast_to_role(self, role: str, message: Message):
+        frame = as_frame(message)
+        for conn in list(self.by_role.get(role, ())):
+            self._offer(conn, frame)
 
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
+    async def publish_to_role(self, role: str, message: Message):
+        frame = as_frame(message)
+        self.broadcast_to_role(role, frame)
+        try:
+            await self.bus.publish(role, frame.text)
+        except Exception:
+            logger.exception("Failed to publish broadcast for role %s", role)
 
-    async def send_to_all_marketers(self, message: str):
-        for conn in self.active_connections:
-            if conn["role"] == "marketer":
-                await conn["ws"].send_text(message)
+    async def send_to_all_marketers(self, message: Message):
+        await self.publish_to_role("marketer", message)
+
+    def _offer(self, conn: Connection, frame: Frame):
+        try:
+            conn.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            if self.slow_consumer_policy == "disconnect":
+                logger.warning("Disconnecting slow consumer %s", conn.user_id)
+                self.disconnect(conn.ws)
+                asyncio.create_task(self._close(conn.ws))
+            else:
+                conn.dropped += 1
+                logger.warning("Dropped frame for slow consumer %s (%d dropped)", conn.user_id, conn.dropped)
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+
+    def get(self, websocket: WebSocket) -> Optional[Connection]:
+        return self.connections.get(websocket)
 
     def get_user_id(self, websocket: WebSocket):
-        for conn in self.active_connections:
-            if conn["ws"] == websocket:
-                return conn["user_id"]
-        return None
\ No newline at end of file
+        conn = self.connections.get(websocket)
+        return conn.user_id if conn else None
+
+    def get_chat_id(self, websocket: WebSocket):
+        conn = self.connections.get(websocket)
+        return conn.chat_id if conn else None
+
+    def count(self, role: Optional[str] = None) -> int:
+        if role is None:
+            return len(self.connections)
+        return len(self.by_role.get(role, ()))
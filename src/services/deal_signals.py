@@ -0,0 +1,150 @@
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_AMOUNT = r"\d{1,3}(?:[ ,]\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?"
+USD_AMOUNT_RE = re.compile(
+    rf"(?:\$|\bus\$|\busd\s?)\s?(?P<pre>{_AMOUNT})\s?(?P<pre_k>k\b)?"
+    rf"|(?P<post>{_AMOUNT})\s?(?P<post_k>k)?\s?(?:\$|\busd\b|\bdollars?\b|\bbucks\b)",
+    re.IGNORECASE
+)
+OTHER_CURRENCY_RE = re.compile(r"[€£₽¥]|\b(?:eur|euros?|gbp|pounds?|rub|rubles?)\b", re.IGNORECASE)
+NUMBER_RE = re.compile(r"\d")
+AVAILABILITY_RE = re.compile(
+    r"\b(?:available|availability|free|busy|booked|slots?|schedule|tomorrow|today|tonight|weekend|"
+    r"next\s+(?:week|month)|this\s+(?:week|month)|in\s+\w+\s+(?:days?|weeks?)|"
+    r"mon(?:day)?|tue(?:s|sday)?|wed(?:nesday)?|thu(?:rs|rsday)?|fri(?:day)?|sat(?:urday)?|sun(?:day)?|"
+    r"jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:tember)?|"
+    r"oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\b|\b\d{1,2}[./]\d{1,2}\b",
+    re.IGNORECASE
+)
+DISCOUNT_RE = re.compile(
+    r"\b(?:discount|off|bundle|package|promo|sale|cheaper|special\s+price)\b|\d+\s?%|\b\d+\s+(?:posts?|stories|reels|videos?)\s+for\b",
+    re.IGNORECASE
+)
+STATUS_RE = re.compile(
+    r"\b(?:deal|agree[ds]?|accept(?:ed)?|confirm(?:ed)?|let'?s\s+do\s+it|decline[ds]?|not\s+interested|"
+    r"no\s+thanks|pass|contract|invoice|sign(?:ed)?|negotiat\w*)\b",
+    re.IGNORECASE
+)
+PRICE_TERM_RE = re.compile(r"\b(?:price|rate|charge|cost|fee|budget)s?\b", re.IGNORECASE)
+# Wording that makes a price approximate or conditional, the LLM parser should interpret it
+HEDGE_RE = re.compile(
+    r"\b(?:around|about|approx\w*|roughly|maybe|depends|from|starting|up\s+to|or|each|per|min(?:imum)?|max(?:imum)?)\b|~|-|–",
+    re.IGNORECASE
+)
+# A price the blogger turns down or asks about is not their price
+NEGATION_RE = re.compile(r"\b(?:no|not|never|nope|nor)\b|\b\w+n['’]t\b|\bcannot\b", re.IGNORECASE)
+# Words that may surround a price that goes straight to the deal ("my price is $500, please")
+FILLER_RE = re.compile(
+    r"\b(?:i|i'?m|we|we'?re|my|our|the|a|an|it|it'?s|its|is|would|will|be|charge|charging|ask|asking|"
+    r"price|rate|fee|cost|usd|dollars?|please|pls|for\s+(?:it|this|that|the\s+(?:post|integration|video|reel|story)))\b",
+    re.IGNORECASE
+)
+# Short answers that accept or reject whatever was just offered
+REPLY_RE = re.compile(
+    r"\b(?:yes|yeah|yep|yup|sure|ok(?:ay)?|no|nope|nah|fine|agreed|sounds\s+(?:good|great|fine)|works\s+for\s+me)\b",
+    re.IGNORECASE
+)
+
+MAX_DIRECT_WORDS = 8
+
+
+@dataclass
+class DealSignals:
+    action: str  # "skip", "direct" or "parse"
+    fields: Dict[str, Any] = field(default_factory=dict)
+    reasons: List[str] = field(default_factory=list)
+
+
+def _to_amount(number: str, thousands: Optional[str]) -> float:
+    value = float(re.sub(r"[ ,]", "", number))
+    return value * 1000 if thousands else value
+
+
+def extract_usd_amounts(text: str) -> List[float]:
+    amounts = []
+    for match in USD_AMOUNT_RE.finditer(text):
+        if match.group("pre") is not None:
+            amounts.append(_to_amount(match.group("pre"), match.group("pre_k")))
+        else:
+            amounts.append(_to_amount(match.group("post"), match.group("post_k")))
+    return amounts
+
+
+def _leftover(text: str) -> str:
+    """
+    What a message says besides its USD amounts and filler words.
+    """
+    rest = FILLER_RE.sub(" ", USD_AMOUNT_RE.sub(" ", text))
+    return re.sub(r"[\W_]+", " ", rest).strip()
+
+
+class DealSignalFilter:
+    """
+    Cheap local stage in front of the LLM parser.
+    Messages without any deal signal (greetings, thanks, emoji) are skipped, a message that is
+    nothing but one plain USD price (filler like "I charge" or "please" aside) is turned into a deal
+    update directly, everything else goes to the parser, short yes/no replies to an offer included.
+    Keeps counters for its hit and skip rates.
+    """
+    def __init__(self, direct_updates: bool = True, report_every: int = 100):
+        self.direct_updates = direct_updates
+        self.report_every = report_every
+        self.counts = {"skip": 0, "direct": 0, "parse": 0}
+
+    def classify(self, text: str) -> DealSignals:
+        signals = self._classify(text or "")
+        self.counts[signals.action] += 1
+        total = sum(self.counts.values())
+        if self.report_every and total % self.report_every == 0:
+            logger.info("Deal signal filter: %s", self.stats())
+        return signals
+
+    def _classify(self, text: str) -> DealSignals:
+        reasons = []
+        amounts = extract_usd_amounts(text)
+        if amounts:
+            reasons.append("usd_amount")
+        if OTHER_CURRENCY_RE.search(text):
+            reasons.append("other_currency")
+        if AVAILABILITY_RE.search(text):
+            reasons.append("availability")
+        if DISCOUNT_RE.search(text):
+            reasons.append("discount")
+        if STATUS_RE.search(text):
+            reasons.append("status")
+        if PRICE_TERM_RE.search(text):
+            reasons.append("price_term")
+        if len(text.split()) <= MAX_DIRECT_WORDS and REPLY_RE.search(text):
+            reasons.append("reply")
+        if not reasons and NUMBER_RE.search(text):
+            # A bare number can still be an answer to "how much do you charge?"
+            reasons.append("number")
+        if not reasons:
+            return DealSignals("skip")
+        simple_price = (
+            set(reasons) <= {"usd_amount", "price_term"}
+            and "usd_amount" in reasons
+            and len(amounts) == 1
+            and len(text.split()) <= MAX_DIRECT_WORDS
+            and not HEDGE_RE.search(text)
+            and not NEGATION_RE.search(text)
+            and "?" not in text
+            and not _leftover(text)
+        )
+        if self.direct_updates and simple_price:
+            return DealSignals("direct", {"price_usd": amounts[0]}, reasons)
+        return DealSignals("parse", reasons=reasons)
+
+    def stats(self) -> Dict[str, Any]:
+        total = sum(self.counts.values())
+        return {
+            **self.counts,
+            "total": total,
+            "skip_rate": self.counts["skip"] / total if total else 0.0,
+            "hit_rate": (self.counts["skip"] + self.counts["direct"]) / total if total else 0.0
+        }
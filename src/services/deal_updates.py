@@ -0,0 +1,60 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+from services.metrics import untraced_task
+
+logger = logging.getLogger(__name__)
+
+FlushHandler = Callable[[str, dict], Awaitable[None]]
+ErrorHandler = Callable[[str, BaseException], Awaitable[None]]
+
+
+class DealUpdateCoalescer:
+    """
+    Merges parser results for the same chat that arrive within a short window,
+    so a burst of messages turns into one deal write and one deal_update broadcast.
+    Later non-null values win, results without any are dropped. Flushes for one chat never overlap.
+    """
+    def __init__(self, on_flush: FlushHandler, window: float = 0.5, on_error: Optional[ErrorHandler] = None):
+        self.on_flush = on_flush
+        self.window = window
+        self.on_error = on_error
+        self.pending: Dict[str, dict] = {}
+        self._flushers: Dict[str, asyncio.Task] = {}
+        self._flush_now = asyncio.Event()
+
+    def submit(self, chat_id: str, fields: dict):
+        values = {k: v for k, v in fields.items() if v is not None}
+        if not values:
+            # Nothing the parser could read: no deal write and no broadcast
+            return
+        self.pending.setdefault(chat_id, {}).update(values)
+        if chat_id not in self._flushers:
+            self._flushers[chat_id] = untraced_task(self._run_flusher(chat_id))
+
+    async def _run_flusher(self, chat_id: str):
+        try:
+            # Results submitted while a write is in flight are picked up by the next iteration
+            while chat_id in self.pending:
+                if not self._flush_now.is_set():
+                    try:
+                        await asyncio.wait_for(self._flush_now.wait(), timeout=self.window)
+                    except asyncio.TimeoutError:
+                        pass
+                fields = self.pending.pop(chat_id)
+                try:
+                    await self.on_flush(chat_id, fields)
+                except Exception as e:
+                    logger.exception("Failed to write deal update for chat %s", chat_id)
+                    if self.on_error:
+                        await self.on_error(chat_id, e)
+        finally:
+            self._flushers.pop(chat_id, None)
+
+    async def close(self):
+        """
+        Write everything that is still pending without waiting for the window.
+        """
+        self._flush_now.set()
+        if self._flushers:
+            await asyncio.gather(*self._flushers.values(), return_exceptions=True)
@@ -0,0 +1,102 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from database.deals import get_all_deals, get_deals_updated_since
+
+SORT_FIELDS = ("updated_at", "price_usd", "status", "availability")
+
+_EPOCH = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def parse_timestamp(value: Optional[str]) -> datetime:
+    if not value:
+        return _EPOCH
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class DealsSnapshot:
+    """
+    In-memory copy of the deals table keyed by chat_id.
+    Loaded once, kept current by apply() on every deal write/broadcast and
+    topped up with an updated_at delta query when it is older than refresh_interval
+    (covers writes made outside this process).
+    updated_at comes from the writing transaction, which may commit after a newer one, so delta
+    queries reach `overlap` seconds behind the cursor; rows already known are simply applied again.
+    """
+    def __init__(self, refresh_interval: float = 30.0, overlap: float = 5.0):
+        self.refresh_interval = refresh_interval
+        self.overlap = timedelta(seconds=overlap)
+        self.deals: Dict[str, Dict[str, Any]] = {}
+        self._updated: Dict[str, datetime] = {}
+        self._latest = _EPOCH
+        self._latest_raw: Optional[str] = None
+        self._refreshed_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def apply(self, deal: Dict[str, Any]):
+        chat_id = deal.get("chat_id")
+        if not chat_id:
+            return
+        updated_at = parse_timestamp(deal.get("updated_at"))
+        if chat_id in self._updated and self._updated[chat_id] > updated_at:
+            return
+        self.deals[chat_id] = deal
+        self._updated[chat_id] = updated_at
+        if updated_at > self._latest:
+            self._latest = updated_at
+            self._latest_raw = deal.get("updated_at")
+
+    async def refresh(self, force: bool = False):
+        async with self._lock:
+            now = time.monotonic()
+            if not force and self._refreshed_at is not None and now - self._refreshed_at < self.refresh_interval:
+                return
+            if self._refreshed_at is None or self._latest_raw is None:
+                rows = await get_all_deals()
+            else:
+                rows = await get_deals_updated_since((self._latest - self.overlap).isoformat())
+            for row in rows:
+                self.apply(row)
+            self._refreshed_at = now
+
+    async def query(
+        self,
+        since: Optional[str] = None,
+        status: Optional[str] = None,
+        sort: str = "updated_at",
+        descending: bool = False,
+        limit: Optional[int] = None,
+        offset: int = 0
+    ) -> Dict[str, Any]:
+        """
+        Deals changed after the `since` cursor (all deals without it), plus the ones updated up to
+        `overlap` seconds before it, so clients replace deals by chat_id.
+        The returned cursor is the newest updated_at known, pass it as `since` on the next sync.
+        """
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"Unsupported sort field: {sort}")
+        await self.refresh()
+        since_ts = parse_timestamp(since) - self.overlap if since else None
+        rows: List[Dict[str, Any]] = [
+            deal for chat_id, deal in self.deals.items()
+            if (since_ts is None or self._updated[chat_id] >= since_ts)
+            and (status is None or deal.get("status") == status)
+        ]
+        if sort == "updated_at":
+            rows.sort(key=lambda d: self._updated[d["chat_id"]], reverse=descending)
+        else:
+            # Nulls always last, whatever the direction
+            present = [d for d in rows if d.get(sort) is not None]
+            missing = [d for d in rows if d.get(sort) is None]
+            present.sort(key=lambda d: d[sort], reverse=descending)
+            rows = present + missing
+        total = len(rows)
+        page = rows[offset:offset + limit] if limit is not None else rows[offset:]
+        return {
+            "deals": page,
+            "total": total,
+            "has_more": offset + len(page) < total,
+            "cursor": self._latest_raw
+        }
@@ -0,0 +1,159 @@
+import asyncio
+import contextvars
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[dict], Awaitable[None]]
+FrameHandler = Callable[[dict, BaseException], Awaitable[None]]
+OrderKey = Callable[[dict], Optional[str]]
+
+# request_id of the frame being handled, replies to it echo it back
+current_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_request_id", default=None)
+_held_order: contextvars.ContextVar[Optional[Callable[[], None]]] = contextvars.ContextVar("held_order", default=None)
+
+
+class OrderedKeys:
+    """
+    FIFO locks by key (chat id), shared by every connection and dropped once nobody holds or waits for them.
+    """
+    def __init__(self):
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._users: Dict[str, int] = {}
+
+    async def acquire(self, key: str):
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._users[key] = self._users.get(key, 0) + 1
+        try:
+            await lock.acquire()
+        except BaseException:
+            self._forget(key)
+            raise
+
+    def release(self, key: str):
+        self._locks[key].release()
+        self._forget(key)
+
+    def _forget(self, key: str):
+        self._users[key] -= 1
+        if not self._users[key]:
+            del self._users[key]
+            del self._locks[key]
+
+
+def release_order():
+    """
+    Called by a handler of an ordered frame once its order-sensitive part is done,
+    so the next frame with the same key can start while this one keeps running.
+    """
+    release = _held_order.get()
+    if release:
+        release()
+
+
+class ConnectionDispatcher:
+    """
+    Runs the frames of one connection as separate tasks, so a long chat_message does not hold up
+    get_deals or get_existing_messages sent after it. Frames that have an order key (chat_message)
+    start one at a time per key in arrival order, everything else runs concurrently.
+    A frame's request_id is available to its handler through current_request_id and can be
+    cancelled with cancel(). At most max_in_flight frames run at once, the others wait for a slot
+    in their own task, so the reader keeps reading (and cancel frames get through).
+    """
+    def __init__(
+        self,
+        handle: Handler,
+        on_error: FrameHandler,
+        on_cancelled: Callable[[dict], Awaitable[None]],
+        order_key: OrderKey,
+        ordering: OrderedKeys,
+        max_in_flight: int = 8
+    ):
+        self.handle = handle
+        self.on_error = on_error
+        self.on_cancelled = on_cancelled
+        self.order_key = order_key
+        self.ordering = ordering
+        # Running frames and their order keys
+        self.tasks: Dict[asyncio.Task, Optional[str]] = {}
+        self.by_request_id: Dict[str, asyncio.Task] = {}
+        self._cancel_requested: Set[asyncio.Task] = set()
+        self._slots = asyncio.Semaphore(max_in_flight)
+
+    def in_flight(self, request_id: str) -> bool:
+        return request_id in self.by_request_id
+
+    def dispatch(self, frame: dict):
+        key = self.order_key(frame)
+        # Tasks take their first step in creation order, so ordered frames queue for the key in arrival order
+        task = asyncio.create_task(self._run(frame, key))
+        self.tasks[task] = key
+        request_id = frame.get("request_id")
+        if request_id is not None:
+            self.by_request_id[request_id] = task
+        task.add_done_callback(lambda t: self._forget(t, request_id))
+
+    def _forget(self, task: asyncio.Task, request_id: Optional[str]):
+        self.tasks.pop(task, None)
+        self._cancel_requested.discard(task)
+        if self.by_request_id.get(request_id) is task:
+            del self.by_request_id[request_id]
+
+    def cancel(self, request_id: str) -> bool:
+        task = self.by_request_id.get(request_id)
+        if task is None or task.done():
+            return False
+        self._cancel_requested.add(task)
+        task.cancel()
+        return True
+
+    async def _run(self, frame: dict, key: Optional[str]):
+        task = asyncio.current_task()
+        current_request_id.set(frame.get("request_id"))
+        released = True
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.ordering.release(key)
+        has_slot = False
+        try:
+            if key is not None:
+                await self.ordering.acquire(key)
+                released = False
+                _held_order.set(release)
+            await self._slots.acquire()
+            has_slot = True
+            await self.handle(frame)
+        except asyncio.CancelledError:
+            if task not in self._cancel_requested:
+                raise
+            await self.on_cancelled(frame)
+        except Exception as e:
+            logger.exception("Failed to handle %s frame", frame.get("type"))
+            await self.on_error(frame, e)
+        finally:
+            if has_slot:
+                self._slots.release()
+            release()
+
+    async def close(self, timeout: Optional[float] = None):
+        """
+        Cancel unordered frames right away and give ordered ones (a chat_message persisting
+        its reply) up to timeout to finish.
+        """
+        ordered = []
+        for task, key in list(self.tasks.items()):
+            if key is None:
+                task.cancel()
+            else:
+                ordered.append(task)
+        if ordered:
+            _, pending = await asyncio.wait(ordered, timeout=timeout)
+            for task in pending:
+                task.cancel()
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
@@ -0,0 +1,84 @@
+import asyncio
+import importlib.util
+import logging
+from typing import Dict, Optional
+import httpx
+from services.env import get_env_var
+from services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+HTTP_MAX_CONNECTIONS = int(get_env_var("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(get_env_var("HTTP_MAX_KEEPALIVE", "50"))
+HTTP_KEEPALIVE_EXPIRY = float(get_env_var("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_CONNECT_TIMEOUT = float(get_env_var("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(get_env_var("HTTP_READ_TIMEOUT", "60"))
+HTTP_PREWARM_CONNECTIONS = int(get_env_var("HTTP_PREWARM_CONNECTIONS", "4"))
+# HTTP/2 needs the h2 package, without it the pools speak HTTP/1.1
+HTTP2 = get_env_var("HTTP2", "true").lower() in ("1", "true", "yes") and importlib.util.find_spec("h2") is not None
+
+TIMEOUT = httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+
+
+class HttpPool:
+    """
+    One keep-alive connection pool per upstream service, shared by every httpx client talking to it
+    (PostgREST and auth for Supabase), created in the app lifespan and closed once on shutdown.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.transport = httpx.AsyncHTTPTransport(
+            http2=HTTP2,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            )
+        )
+        pools[name] = self
+
+    def client(self, **kwargs) -> httpx.AsyncClient:
+        """
+        An httpx client on this pool. Closing it closes the pool, close the pool instead.
+        """
+        return httpx.AsyncClient(transport=self.transport, timeout=TIMEOUT, follow_redirects=True, **kwargs)
+
+    async def prewarm(self, url: str, headers: Optional[Dict[str, str]] = None, connections: int = HTTP_PREWARM_CONNECTIONS):
+        """
+        Open connections (TCP and TLS handshakes) before the first request needs them.
+        Any response will do, failures are only logged.
+        """
+        client = self.client(headers=headers)
+        # With HTTP/2 one connection carries every request
+        count = 1 if HTTP2 else connections
+        results = await asyncio.gather(*(client.get(url) for _ in range(count)), return_exceptions=True)
+        failed = [r for r in results if isinstance(r, Exception)]
+        if failed:
+            logger.warning("Prewarming %s pool failed: %r", self.name, failed[0])
+
+    def stats(self) -> Dict[str, int]:
+        pool = self.transport._pool
+        connections = pool.connections
+        idle = sum(1 for c in connections if c.is_idle())
+        return {
+            "connections": len(connections),
+            "idle": idle,
+            "active": len(connections) - idle,
+            # Requests being served or waiting for a connection
+            "requests": len(getattr(pool, "_requests", ()))
+        }
+
+    async def close(self):
+        await self.transport.aclose()
+        pools.pop(self.name, None)
+
+
+pools: Dict[str, HttpPool] = {}
+
+
+def _stat(key: str) -> Dict[str, int]:
+    return {name: pool.stats()[key] for name, pool in list(pools.items())}
+
+registry.gauge("bloggers_crm_http_pool_connections", "Open upstream connections", lambda: _stat("connections"), label="pool")
+registry.gauge("bloggers_crm_http_pool_active_connections", "Upstream connections serving a request", lambda: _stat("active"), label="pool")
+registry.gauge("bloggers_crm_http_pool_requests", "Upstream requests in progress or waiting for a connection", lambda: _stat("requests"), label="pool")
@@ -1,19 +1,90 @@
-from typing import Dict, Any, Literal
+from typing import Dict, Any, Literal, Callable, Awaitable, Optional, List
 import openai
-from services.assistant_cache import AssistantCache
+from services.assistant_cache import AssistantCache, PresaleAssistants, get_prompt_from_file
+from schemas import DealFields
 from services.env import get_env_var
+from services.thread_scheduler import ThreadRunScheduler
+from services.run_poller import RunStatusPoller
+from services.metrics import registry, span, timed
+from services.run_admission import RunAdmission
+from services.http_pool import HttpPool, TIMEOUT as HTTP_TIMEOUT
 import asyncio
+import logging
 
-openai_client = openai.AsyncOpenAI(api_key=get_env_var("OPENAI_API_KEY"))
-assistant_cache = AssistantCache(openai_client)
+logger = logging.getLogger(__name__)
 
-def send_welcome_text_to_thread(welcome_text: str, thread_id: str):
-    return openai_client.beta.threads.messages.create(
+_openai_client: Optional[openai.AsyncOpenAI] = None
+_openai_pool: Optional[HttpPool] = None
+
+def get_openai_client() -> openai.AsyncOpenAI:
+    if _openai_client is None:
+        raise RuntimeError("OpenAI client is not open, open_openai_client() runs in the app lifespan")
+    return _openai_client
+
+async def open_openai_client():
+    global _openai_client, _openai_pool
+    pool = HttpPool("openai")
+    client = openai.AsyncOpenAI(
+        api_key=get_env_var("OPENAI_API_KEY"),
+        http_client=pool.client(),
+        timeout=HTTP_TIMEOUT
+    )
+    await pool.prewarm(f"{client.base_url}models", headers={"Authorization": f"Bearer {client.api_key}"})
+    _openai_client, _openai_pool = client, pool
+
+async def close_openai_client():
+    global _openai_client, _openai_pool
+    if _openai_pool is not None:
+        await _openai_pool.close()
+    _openai_client, _openai_pool = None, None
+
+assistant_cache = AssistantCache(get_openai_client)
+
+# Assistant runs started by this process that have not finished yet
+runs_in_flight = registry.gauge("bloggers_crm_openai_runs_in_flight", "Assistant runs currently in progress")
+
+# Messages after the chat summary are kept between CONVERSATION_WINDOW and CONVERSATION_WINDOW + COMPACTION_THRESHOLD
+# (see services.compaction), runs see that many so nothing falls between the window and the summary.
+# A CONVERSATION_WINDOW of 0 turns compaction off and leaves truncation to OpenAI.
+CONVERSATION_WINDOW = int(get_env_var("CONVERSATION_WINDOW", "20"))
+COMPACTION_THRESHOLD = int(get_env_var("COMPACTION_THRESHOLD", "20"))
+RUN_MESSAGES = CONVERSATION_WINDOW + COMPACTION_THRESHOLD
+SUMMARY_MODEL = get_env_var("SUMMARY_MODEL", "gpt-4o-mini")
+
+openai_tokens = registry.counter("bloggers_crm_openai_tokens_total", "Tokens used by runs and completions")
+prompt_tokens = registry.histogram(
+    "bloggers_crm_openai_prompt_tokens", "Prompt tokens per run or completion",
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+)
+
+def record_usage(assistant: str, usage: Any):
+    # Runs report usage once they are completed, it stays None for the others
+    if usage is None:
+        return
+    openai_tokens.inc(usage.prompt_tokens, assistant=assistant, kind="prompt")
+    openai_tokens.inc(usage.completion_tokens, assistant=assistant, kind="completion")
+    prompt_tokens.observe(usage.prompt_tokens, assistant=assistant)
+
+def run_options(context: Optional[str]) -> Dict[str, Any]:
+    """
+    Extra runs.create arguments: the recent-message window and the chat's summary and deal as additional instructions.
+    """
+    options: Dict[str, Any] = {}
+    if CONVERSATION_WINDOW > 0:
+        options["truncation_strategy"] = {"type": "last_messages", "last_messages": RUN_MESSAGES}
+    if context:
+        options["additional_instructions"] = context
+    return options
+
+@timed("openai.messages.create")
+async def send_welcome_text_to_thread(welcome_text: str, thread_id: str):
+    return await get_openai_client().beta.threads.messages.create(
         thread_id=thread_id,
         role="assistant",
         content=welcome_text
     )
 
+@timed("openai.runs.wait_thread_free")
 async def wait_for_thread_free(thread_id: str, timeout: int = 30, poll_interval: float = 1.0):
     """
     Wait until there is no active run for the thread.
@@ -21,7 +92,7 @@ async def wait_for_thread_free(thread_id: str, timeout: int = 30, poll_interval:
     import time
     start = time.time()
     while True:
-        runs = await openai_client.beta.threads.runs.list(thread_id=thread_id, limit=1)
+        runs = await get_openai_client().beta.threads.runs.list(thread_id=thread_id, limit=1)
         if not runs.data:
             return
         last_run = runs.data[0]
@@ -32,23 +103,64 @@ async def wait_for_thread_free(thread_id: str, timeout: int = 30, poll_interval:
             raise TimeoutError(f"Thread {thread_id} still has an active run after {timeout} seconds")
         await asyncio.sleep(poll_interval)
 
-async def wait_for_run_complete(thread_id: str, run_id: str, timeout: int = 60, poll_interval: float = 1.0):
+# Runs are serialized per thread in-process, the API is only polled for runs left over from before a restart
+thread_scheduler = ThreadRunScheduler(remote_check=wait_for_thread_free)
+
+@timed("openai.runs.retrieve")
+async def retrieve_run(thread_id: str, run_id: str):
+    return await get_openai_client().beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+
+# Shared by every run in the process: adaptive per-run intervals under one global request budget
+run_poller = RunStatusPoller(
+    retrieve_run,
+    max_rps=float(get_env_var("OPENAI_POLL_MAX_RPS", "20")),
+    initial_interval=float(get_env_var("OPENAI_POLL_INITIAL_INTERVAL", "0.25")),
+    max_interval=float(get_env_var("OPENAI_POLL_MAX_INTERVAL", "2.0"))
+)
+
+class RunFailed(RuntimeError):
+    pass
+
+def run_failed(thread_id: str, run, status: Optional[str]) -> RunFailed:
+    last_error = getattr(run, "last_error", None)
+    incomplete = getattr(run, "incomplete_details", None)
+    reason = last_error.message if last_error else getattr(incomplete, "reason", None) or status
+    return RunFailed(f"Run on thread {thread_id} did not complete: {reason}")
+
+# Caps concurrent runs process-wide, manager replies first; failures of these kinds count towards the circuit breaker
+run_admission = RunAdmission(
+    max_concurrent=int(get_env_var("OPENAI_MAX_CONCURRENT_RUNS", "16")),
+    max_queued=int(get_env_var("OPENAI_MAX_QUEUED_RUNS", "64")),
+    failure_threshold=int(get_env_var("OPENAI_BREAKER_FAILURES", "5")),
+    cooldown=float(get_env_var("OPENAI_BREAKER_COOLDOWN", "30")),
+    failure_types=(openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError, TimeoutError, RunFailed)
+)
+registry.gauge("bloggers_crm_openai_runs_admitted", "Runs holding an admission slot", lambda: run_admission.active)
+registry.gauge("bloggers_crm_openai_runs_queued", "Runs waiting for an admission slot", lambda: run_admission.queued, label="run_class")
+registry.counter("bloggers_crm_openai_runs_rejected_total", "Runs rejected by admission control", lambda: run_admission.rejected, label="reason")
+registry.gauge("bloggers_crm_openai_circuit_state", "OpenAI circuit breaker: 0 closed, 0.5 trial run, 1 open", run_admission.state)
+
+@timed("openai.runs.wait")
+async def wait_for_run_complete(thread_id: str, run_id: str, timeout: int = 60):
     """
     Wait until the run is completed or failed.
     """
-    import time
-    start = time.time()
-    while True:
-        run = await openai_client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
-        status = getattr(run, "status", None)
-        if status in ("completed", "failed", "cancelled", "expired"):
-            return run
-        if time.time() - start > timeout:
-            raise TimeoutError(f"Run {run_id} did not complete after {timeout} seconds")
-        await asyncio.sleep(poll_interval)
+    return await run_poller.wait(thread_id, run_id, timeout)
 
+@timed("openai.runs.cancel")
+async def cancel_run(thread_id: str, run_id: str):
+    """
+    A run waiting in requires_action (the assistants have no tools to answer it) keeps the thread
+    locked until it expires, so it is cancelled. Best effort.
+    """
+    try:
+        await get_openai_client().beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+    except Exception as e:
+        logger.warning("Failed to cancel run %s on thread %s: %r", run_id, thread_id, e)
+
+@timed("openai.messages.list")
 async def get_latest_assistant_message(thread_id: str) -> str:
-    messages = await openai_client.beta.threads.messages.list(thread_id=thread_id, limit=20)
+    messages = await get_openai_client().beta.threads.messages.list(thread_id=thread_id, limit=20)
     # Find the latest message with role="assistant"
     for msg in reversed(messages.data):
         if getattr(msg, "role", None) == "assistant":
@@ -66,40 +178,74 @@ async def get_latest_assistant_message(thread_id: str) -> str:
             return str(content)
     return ""
 
+@timed("openai.threads.create")
 async def create_openai_thread() -> str:
-    thread = await openai_client.beta.threads.create()
+    thread = await get_openai_client().beta.threads.create()
     return thread.id
 
-async def create_user_message_in_thread(message: str, thread_id: str) -> Dict[str, Any]:
+async def create_user_message_in_thread(
+    message: str,
+    thread_id: str,
+    on_queued: Optional[Callable[[], None]] = None
+) -> Dict[str, Any]:
     """
     Add a user message to the thread and return its instance.
+    The returned run_ticket is passed to process_assistant_response to coalesce follow-up runs,
+    on_queued as in ThreadRunScheduler.post.
     """
-    await wait_for_thread_free(thread_id)
-    msg = await openai_client.beta.threads.messages.create(
-        thread_id=thread_id,
-        role="user",
-        content=message
-    )
+    @timed("openai.messages.create")
+    async def post():
+        return await get_openai_client().beta.threads.messages.create(
+            thread_id=thread_id,
+            role="user",
+            content=message
+        )
+    msg, ticket = await thread_scheduler.post(thread_id, post, on_queued)
     # Return message id and content
     return {
         "id": msg.id,
         "role": msg.role,
         "content": msg.content,
-        "created_at": getattr(msg, "created_at", None)
+        "created_at": getattr(msg, "created_at", None),
+        "run_ticket": ticket
     }
 
-async def process_assistant_response(assistant: Literal["manager", "parser"], thread_id: str) -> Dict[str, Any]:
+async def process_assistant_response(
+    assistant: Literal["manager", "parser"],
+    thread_id: str,
+    run_ticket: Optional[int] = None,
+    context: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
     """
     Run the assistant on the thread and return the assistant's message instance.
+    context (the chat summary and deal, see run_options) is added to the assistant's instructions.
+    Returns None when the message behind run_ticket was already answered by a run for a later message.
     """
+    return await thread_scheduler.run(thread_id, lambda: _run_and_fetch_reply(assistant, thread_id, context), run_ticket)
+
+async def _run_and_fetch_reply(assistant: Literal["manager", "parser"], thread_id: str, context: Optional[str]) -> Dict[str, Any]:
     assistant_id = await assistant_cache.get_assistant_id(assistant)
-    run = await openai_client.beta.threads.runs.create(
-        thread_id=thread_id,
-        assistant_id=assistant_id
-    )
-    await wait_for_run_complete(thread_id, run.id)
+    async with run_admission.slot(assistant):
+        runs_in_flight.inc()
+        try:
+            async with span("openai.runs.create"):
+                run = await get_openai_client().beta.threads.runs.create(
+                    thread_id=thread_id,
+                    assistant_id=assistant_id,
+                    **run_options(context)
+                )
+            run = await wait_for_run_complete(thread_id, run.id)
+        finally:
+            runs_in_flight.dec()
+        record_usage(assistant, getattr(run, "usage", None))
+        status = getattr(run, "status", None)
+        if status != "completed":
+            if status == "requires_action":
+                await cancel_run(thread_id, run.id)
+            raise run_failed(thread_id, run, status)
     # Get latest assistant message
-    messages = await openai_client.beta.threads.messages.list(thread_id=thread_id, limit=20)
+    async with span("openai.messages.list"):
+        messages = await get_openai_client().beta.threads.messages.list(thread_id=thread_id, limit=20)
     for msg in messages.data:
         if getattr(msg, "role", None) == "assistant":
             return {
@@ -108,4 +254,108 @@ async def process_assistant_response(assistant: Literal["manager", "parser"], th
                 "content": msg.content,
                 "created_at": getattr(msg, "created_at", None)
             }
-    return {}
\ No newline at end of file
+    return {}
+
+async def stream_assistant_response(
+    assistant: Literal["manager", "parser"],
+    thread_id: str,
+    on_delta: Callable[[str, str], Awaitable[None]],
+    run_ticket: Optional[int] = None,
+    context: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Run the assistant on the thread with streaming enabled.
+    Every text delta is passed to on_delta(message_id, text) as soon as it arrives,
+    the completed assistant's message instance is returned when the run finishes.
+    Returns None when the run was coalesced, as in process_assistant_response.
+    """
+    return await thread_scheduler.run(thread_id, lambda: _stream_reply(assistant, thread_id, on_delta, context), run_ticket)
+
+async def _stream_reply(
+    assistant: Literal["manager", "parser"],
+    thread_id: str,
+    on_delta: Callable[[str, str], Awaitable[None]],
+    context: Optional[str]
+) -> Dict[str, Any]:
+    assistant_id = await assistant_cache.get_assistant_id(assistant)
+    async with run_admission.slot(assistant):
+        runs_in_flight.inc()
+        try:
+            async with span("openai.runs.stream"):
+                return await _consume_stream(assistant, assistant_id, thread_id, on_delta, context)
+        finally:
+            runs_in_flight.dec()
+
+async def _consume_stream(
+    assistant: str,
+    assistant_id: str,
+    thread_id: str,
+    on_delta: Callable[[str, str], Awaitable[None]],
+    context: Optional[str]
+) -> Dict[str, Any]:
+    stream = await get_openai_client().beta.threads.runs.create(
+        thread_id=thread_id,
+        assistant_id=assistant_id,
+        stream=True,
+        **run_options(context)
+    )
+    message = None
+    async with stream:
+        async for event in stream:
+            if event.event == "thread.message.delta":
+                for part in event.data.delta.content or []:
+                    if part.type == "text" and part.text and part.text.value:
+                        await on_delta(event.data.id, part.text.value)
+            elif event.event == "thread.message.completed":
+                message = event.data
+            elif event.event == "thread.run.completed":
+                record_usage(assistant, getattr(event.data, "usage", None))
+            elif event.event == "thread.run.requires_action":
+                await cancel_run(thread_id, event.data.id)
+                raise run_failed(thread_id, event.data, event.event)
+            elif event.event in ("thread.run.failed", "thread.run.cancelled", "thread.run.expired", "thread.run.incomplete"):
+                record_usage(assistant, getattr(event.data, "usage", None))
+                raise run_failed(thread_id, event.data, event.event)
+    if message is None:
+        return {}
+    return {
+        "id": message.id,
+        "role": message.role,
+        "content": message.content,
+        "created_at": getattr(message, "created_at", None)
+    }
+
+@timed("openai.chat.parse")
+async def extract_deal_fields(conversation: List[Dict[str, str]]) -> Optional[DealFields]:
+    """
+    Stateless parser: one structured-output completion over a window of the conversation,
+    validated against DealFields. No thread, run or polling involved.
+    """
+    config = PresaleAssistants["parser"]
+    async with run_admission.slot("parser"):
+        completion = await get_openai_client().beta.chat.completions.parse(
+            model=get_env_var("PARSER_MODEL", config["model"]),
+            temperature=0,
+            messages=[{"role": "system", "content": config["getAssistantInstruction"]()}, *conversation],
+            response_format=DealFields
+        )
+    record_usage("parser", completion.usage)
+    return completion.choices[0].message.parsed
+
+@timed("openai.chat.summarize")
+async def summarize_conversation(prompt: str) -> str:
+    """
+    One completion that folds older turns into the chat's rolling summary, see services.compaction.
+    """
+    # Background work, queued behind manager replies like the parser
+    async with run_admission.slot("parser"):
+        completion = await get_openai_client().chat.completions.create(
+            model=SUMMARY_MODEL,
+            temperature=0,
+            messages=[
+                {"role": "system", "content": get_prompt_from_file("summary.txt")},
+                {"role": "user", "content": prompt}
+            ]
+        )
+    record_usage("summary", completion.usage)
+    return (completion.choices[0].message.content or "").strip()
@@ -0,0 +1,331 @@
+import asyncio
+import glob
+import json
+import logging
+import os
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from schemas import MessageIn
+from database.db_connection import is_permanent_error
+from database.messages import insert_messages
+from services.env import get_env_var
+from services.metrics import registry, untraced_task
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+InsertRows = Callable[[List[Dict[str, Any]]], Awaitable[Any]]
+IsPermanent = Callable[[BaseException], bool]
+
+
+class MessageWriter:
+    """
+    Write-behind persistence for chat messages.
+    submit() gives the row its id and returns at once, a background flusher writes queued rows
+    as multi-row inserts when batch_size rows are waiting or flush_interval has passed.
+    Rows are appended to a local spool file before they are queued and the spool is replayed
+    on start, so rows that were not written when the process died are written on the next start.
+    Every process has its own spool next to spool_path (name.<pid>-<random>.ext), locked while it runs;
+    start() also takes over the spools of processes that are gone. Inserts are idempotent on id,
+    writing a replayed row twice is harmless.
+    A batch the database rejects for good (is_permanent) is split until the rejected rows are found;
+    those are logged and dropped (dead-lettered) so they cannot hold up the rows behind them.
+    Other failures are retried with a backoff from retry_interval up to max_retry_interval; after
+    max_attempts in a row (about 13 minutes with the defaults) the batch is treated as rejected as well.
+    """
+    def __init__(
+        self,
+        insert_rows: InsertRows,
+        spool_path: Optional[str] = None,
+        batch_size: int = 100,
+        flush_interval: float = 0.2,
+        retry_interval: float = 1.0,
+        max_retry_interval: float = 30.0,
+        max_attempts: int = 30,
+        is_permanent: IsPermanent = lambda error: False
+    ):
+        self.insert_rows = insert_rows
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.max_attempts = max_attempts
+        self.is_permanent = is_permanent
+        self.queued: List[Dict[str, Any]] = []
+        self.writing: List[Dict[str, Any]] = []
+        self.written = 0
+        self.failed_batches = 0
+        self.dead_lettered = 0
+        self.last_error: Optional[BaseException] = None
+        self._spool = None
+        self._spooled = 0
+        self._own_path: Optional[str] = None
+        self._lock = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._flush_now = asyncio.Event()
+        self._batch_done = asyncio.Condition()
+        self._closing = False
+        # Failures in a row of the batch at the head of the queue
+        self._attempts = 0
+
+    async def start(self):
+        """
+        Queue the rows left in the spools of processes that are gone and start the flusher.
+        """
+        if self.spool_path:
+            root, ext = os.path.splitext(self.spool_path)
+            # Unique even when containers sharing the directory reuse pids
+            self._own_path = f"{root}.{os.getpid()}-{uuid.uuid4().hex[:8]}{ext}"
+            self._lock = self._try_lock(self._own_path)
+            orphans = self._claim_orphans()
+            replayed = [row for _, _, rows in orphans for row in rows]
+            for path, _, rows in orphans:
+                logger.info("Taking over %d unwritten messages from %s", len(rows), path)
+            known = {row["id"] for row in self.queued}
+            self.queued[:0] = [row for row in {r["id"]: r for r in replayed}.values() if row["id"] not in known]
+            self._rewrite_spool()
+            # Only dropped once their rows are safe in this process's spool
+            for path, lock, _ in orphans:
+                self._remove_spool(path, lock)
+            if replayed:
+                logger.info("Replaying %d unwritten messages", len(replayed))
+        self._ensure_flusher()
+        if self.queued:
+            self._wakeup.set()
+
+    def submit(self, message: MessageIn) -> Dict[str, Any]:
+        row = {
+            "id": message.id or str(uuid.uuid4()),
+            "chat_id": message.chat_id,
+            "sender": message.sender,
+            "content": message.content,
+            "openai_message_id": message.openai_message_id,
+            "created_at": message.created_at,
+        }
+        if self._spool is not None:
+            self._spool.write(json.dumps(row) + "\n")
+            self._spool.flush()
+            self._spooled += 1
+        self.queued.append(row)
+        if len(self.queued) >= self.batch_size:
+            self._flush_now.set()
+        self._wakeup.set()
+        self._ensure_flusher()
+        return row
+
+    def pending(self, chat_id: str) -> List[Dict[str, Any]]:
+        """
+        Rows of the chat that may not be in the database yet, oldest first.
+        """
+        return [row for row in self.writing + self.queued if row["chat_id"] == chat_id]
+
+    async def flush(self, chat_id: Optional[str] = None):
+        """
+        Write queued rows (only until the chat's rows are written when chat_id is given)
+        without waiting for the interval. Raises the write error if the database rejects them.
+        """
+        while self._has_pending(chat_id):
+            self._ensure_flusher()
+            self._flush_now.set()
+            self._wakeup.set()
+            async with self._batch_done:
+                await self._batch_done.wait()
+            if self.last_error is not None:
+                raise self.last_error
+
+    async def close(self, timeout: Optional[float] = None):
+        """
+        Write everything still queued. Rows that cannot be written within the timeout stay
+        in the spool for the next start.
+        """
+        self._closing = True
+        self._flush_now.set()
+        self._wakeup.set()
+        if self._task:
+            try:
+                await asyncio.wait_for(self._task, timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning("%d messages not written at shutdown, kept in the spool", len(self.queued) + len(self.writing))
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+            if not self.queued and not self.writing:
+                self._remove_spool(self._own_path, self._lock)
+                self._lock = None
+
+    def _has_pending(self, chat_id: Optional[str]) -> bool:
+        if chat_id:
+            return bool(self.pending(chat_id))
+        return bool(self.queued or self.writing)
+
+    def _ensure_flusher(self):
+        if self._task is None or self._task.done():
+            self._task = untraced_task(self._run())
+
+    async def _run(self):
+        while True:
+            if not self.queued:
+                self._flush_now.clear()
+                if self._closing:
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            if not self._flush_now.is_set():
+                try:
+                    await asyncio.wait_for(self._flush_now.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            if not await self._write_batch():
+                await asyncio.sleep(min(self.retry_interval * 2 ** (self._attempts - 1), self.max_retry_interval))
+
+    async def _write_batch(self) -> bool:
+        batch = self.queued[:self.batch_size]
+        del self.queued[:len(batch)]
+        self.writing = batch
+        dropped: List[str] = []
+        try:
+            await self._write_rows(batch, dropped, give_up=self._attempts + 1 >= self.max_attempts)
+        except Exception as e:
+            self._attempts += 1
+            logger.exception("Failed to write %d messages (attempt %d), retrying", len(batch), self._attempts)
+            self.failed_batches += 1
+            self.last_error = e
+            self.queued[:0] = [row for row in batch if row["id"] not in dropped]
+            return False
+        else:
+            self._attempts = 0
+            self.last_error = None
+            return True
+        finally:
+            self.writing = []
+            if dropped and self._spool is not None:
+                # Dead-lettered rows must not come back with the next replay
+                self._rewrite_spool()
+            elif self.last_error is None:
+                self._compact_spool()
+            async with self._batch_done:
+                self._batch_done.notify_all()
+
+    async def _write_rows(self, rows: List[Dict[str, Any]], dropped: List[str], give_up: bool):
+        """
+        Insert rows, halving a rejected batch until the rejected rows are isolated and dead-lettered.
+        With give_up every failure counts as a rejection. Rows already written when a retryable
+        error is raised are simply written again on the retry.
+        """
+        try:
+            await self.insert_rows(rows)
+        except Exception as e:
+            if not (give_up or self.is_permanent(e)):
+                raise
+            if len(rows) == 1:
+                self.dead_lettered += 1
+                dropped.append(rows[0]["id"])
+                logger.error("Dropping message the database rejects: %r, row: %s", e, json.dumps(rows[0]))
+                return
+            middle = len(rows) // 2
+            await self._write_rows(rows[:middle], dropped, give_up)
+            await self._write_rows(rows[middle:], dropped, give_up)
+            return
+        self.written += len(rows)
+
+    def _try_lock(self, path: str):
+        """
+        The open lock file of a spool when this process got its lock, None when another process holds it.
+        """
+        lock = open(f"{path}.lock", "a")
+        if fcntl is None:
+            return lock
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return None
+        return lock
+
+    def _claim_orphans(self) -> List[tuple]:
+        """
+        Spools of other processes that are no longer running (their lock is free), and the
+        spool_path file itself as written before spools were per process.
+        """
+        root, ext = os.path.splitext(self.spool_path)
+        paths = set(glob.glob(f"{glob.escape(root)}.*{ext}"))
+        paths.add(self.spool_path)
+        paths.discard(self._own_path)
+        # Without fcntl there is no way to tell a live process's spool from an abandoned one
+        if fcntl is None:
+            paths = {self.spool_path}
+        orphans = []
+        for path in sorted(paths):
+            if not os.path.exists(path):
+                continue
+            lock = self._try_lock(path)
+            if lock is None:
+                continue
+            orphans.append((path, lock, self._read_spool(path)))
+        return orphans
+
+    def _remove_spool(self, path: str, lock):
+        for name in (path, f"{path}.lock"):
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                pass
+        if lock is not None:
+            lock.close()
+
+    def _read_spool(self, path: str) -> List[Dict[str, Any]]:
+        if not os.path.exists(path):
+            return []
+        rows: Dict[str, Dict[str, Any]] = {}
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash
+                    continue
+                rows[row["id"]] = row
+        return list(rows.values())
+
+    def _compact_spool(self):
+        # Truncating on every batch would rewrite the queue each time, so written rows are only
+        # dropped once the queue is empty or the spool has grown well past it
+        if self._spool is None:
+            return
+        if not self.queued:
+            self._spool.truncate(0)
+            self._spooled = 0
+        elif self._spooled > len(self.queued) + 10 * self.batch_size:
+            self._rewrite_spool()
+
+    def _rewrite_spool(self):
+        if self._spool is not None:
+            self._spool.close()
+        tmp_path = f"{self._own_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(row) + "\n" for row in self.queued)
+        os.replace(tmp_path, self._own_path)
+        self._spool = open(self._own_path, "a", encoding="utf-8")
+        self._spooled = len(self.queued)
+
+
+message_writer = MessageWriter(
+    insert_messages,
+    spool_path=get_env_var("MESSAGE_SPOOL_PATH", ".message_spool.jsonl"),
+    batch_size=int(get_env_var("MESSAGE_BATCH_SIZE", "100")),
+    flush_interval=float(get_env_var("MESSAGE_FLUSH_INTERVAL", "0.2")),
+    max_attempts=int(get_env_var("MESSAGE_WRITE_ATTEMPTS", "30")),
+    is_permanent=is_permanent_error
+)
+
+registry.gauge("bloggers_crm_messages_queued", "Messages waiting to be written", lambda: len(message_writer.queued) + len(message_writer.writing))
+registry.counter("bloggers_crm_messages_written_total", "Messages written by the batching writer", lambda: message_writer.written)
+registry.counter("bloggers_crm_message_batches_failed_total", "Message batches that failed and were retried", lambda: message_writer.failed_batches)
+registry.counter("bloggers_crm_messages_dead_lettered_total", "Messages the database rejected, logged and dropped", lambda: message_writer.dead_lettered)
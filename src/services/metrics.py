@@ -0,0 +1,231 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import time
+from bisect import bisect_left
+from contextlib import asynccontextmanager, nullcontext
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from services.env import get_env_var
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = get_env_var("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# Handlers slower than this log a per-stage breakdown (0 disables the log)
+SLOW_REQUEST_THRESHOLD_MS = float(get_env_var("SLOW_REQUEST_THRESHOLD_MS", "5000"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted(labels.items()))
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+class Gauge:
+    """
+    Either set explicitly or computed at scrape time by `func`
+    (a number, or a dict of label values to numbers for a single `label`).
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, func: Optional[Callable[[], Union[float, Dict[str, float]]]] = None, label: str = ""):
+        self.name = name
+        self.help = help_text
+        self.func = func
+        self.label = label
+        self.values: Dict[Labels, float] = {}
+
+    def set(self, value: float, **labels: str):
+        self.values[_labels(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = _labels(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str):
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        values = dict(self.values)
+        if self.func is not None:
+            try:
+                result = self.func()
+            except Exception:
+                logger.exception("Metric callback %s failed", self.name)
+                result = {}
+            if isinstance(result, dict):
+                values.update({((self.label, str(k)),): float(v) for k, v in result.items()})
+            else:
+                values[()] = float(result)
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{self.name}{_format_labels(k)} {v}" for k, v in values.items()]
+        return lines
+
+
+class Counter(Gauge):
+    kind = "counter"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        # labels -> (per-bucket counts, sum, count)
+        self.values: Dict[Labels, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = _labels(labels)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = ([0] * (len(self.buckets) + 1), 0.0, 0)
+        counts, total, count = entry
+        counts[bisect_left(self.buckets, value)] += 1
+        self.values[key] = (counts, total + value, count + 1)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', str(bound)))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Union[Counter, Gauge, Histogram]] = {}
+
+    def _register(self, metric):
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str, func=None, label: str = "") -> Counter:
+        return self._register(Counter(name, help_text, func, label))
+
+    def gauge(self, name: str, help_text: str, func=None, label: str = "") -> Gauge:
+        return self._register(Gauge(name, help_text, func, label))
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_duration = registry.histogram("bloggers_crm_stage_duration_seconds", "Duration of Supabase/OpenAI calls and internal stages")
+stage_errors = registry.counter("bloggers_crm_stage_errors_total", "Failed Supabase/OpenAI calls and internal stages")
+handler_duration = registry.histogram("bloggers_crm_handler_duration_seconds", "Duration of WebSocket frame handlers")
+
+class _Stages(list):
+    """
+    (stage, seconds) pairs of one handler; closed when the handler returns, so tasks that
+    inherited the context and keep running record nothing more into it.
+    """
+    closed = False
+
+
+# Stages recorded while the current handler runs
+_current_trace: contextvars.ContextVar[Optional[_Stages]] = contextvars.ContextVar("current_trace", default=None)
+
+
+@asynccontextmanager
+async def _span(name: str):
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_duration.observe(elapsed, stage=name)
+        if failed:
+            stage_errors.inc(stage=name)
+        trace = _current_trace.get()
+        if trace is not None and not trace.closed:
+            trace.append((name, elapsed))
+
+
+def span(name: str):
+    """
+    Time a block as a stage: `async with span("openai.runs.create"): ...`
+    """
+    return _span(name) if METRICS_ENABLED else nullcontext()
+
+
+def timed(name: str):
+    """
+    Decorator form of span() for coroutine functions; a no-op when metrics are disabled.
+    """
+    def decorator(fn):
+        if not METRICS_ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            async with _span(name):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@asynccontextmanager
+async def _trace(handler: str):
+    stages = _Stages()
+    token = _current_trace.set(stages)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stages.closed = True
+        _current_trace.reset(token)
+        handler_duration.observe(elapsed, handler=handler)
+        if SLOW_REQUEST_THRESHOLD_MS and elapsed * 1000 >= SLOW_REQUEST_THRESHOLD_MS:
+            breakdown = ", ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in stages)
+            logger.warning("Slow %s: %.0fms [%s]", handler, elapsed * 1000, breakdown)
+
+
+def trace(handler: str):
+    """
+    Time a WebSocket handler and collect the stages it goes through for the slow-request log.
+    """
+    return _trace(handler) if METRICS_ENABLED else nullcontext()
+
+
+def untraced_task(coro) -> asyncio.Task:
+    """
+    Start a task that outlives the handler that happens to start it (shared loops, per-chat workers)
+    in an empty context, so its stages are not charged to that handler's trace.
+    """
+    return asyncio.create_task(coro, context=contextvars.Context())
+
+
+router = APIRouter()
+
+@router.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,179 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Tuple, Type
+from services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first: manager replies are user facing, parser extraction is background work
+PRIORITIES = {"manager": 0, "parser": 1}
+
+# Set by check() in the request that reserved the trial run of a half-open circuit, read by its slot()
+_reserved_probe: contextvars.ContextVar[object] = contextvars.ContextVar("reserved_probe", default=None)
+
+admission_wait = registry.histogram("bloggers_crm_openai_admission_wait_seconds", "Time runs waited for an admission slot")
+
+
+class RunRejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"OpenAI runs are not admitted right now ({reason}), retry in {retry_after:.0f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RunAdmission:
+    """
+    Process-wide admission control for OpenAI runs and completions.
+    At most max_concurrent hold a slot, the rest wait in priority order (manager before parser, FIFO within a class).
+    check() sheds new manager work when max_queued manager runs are already waiting.
+    After failure_threshold consecutive failures of failure_types the circuit opens: everything is rejected
+    for cooldown seconds, then a single trial run decides whether it closes again. The first check()
+    after the cooldown reserves the trial for its request (claimed by that request's slot(), or dropped
+    after another cooldown), every other check() keeps rejecting until the trial is over.
+    """
+    def __init__(
+        self,
+        max_concurrent: int = 16,
+        max_queued: int = 64,
+        failure_threshold: int = 5,
+        cooldown: float = 30.0,
+        failure_types: Tuple[Type[BaseException], ...] = (TimeoutError,)
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failure_types = failure_types
+        self.active = 0
+        self.queued: Dict[str, int] = {name: 0 for name in PRIORITIES}
+        self.rejected: Dict[str, int] = {"overloaded": 0, "circuit_open": 0}
+        self.failures = 0
+        self.open_until = 0.0
+        # Rough duration of a slot, used for retry_after
+        self.avg_duration = 5.0
+        self._probing = False
+        # A reserved trial that never reached slot() (coalesced, failed before the run) stops blocking then
+        self._probe_deadline = float("inf")
+        self._waiters: List[list] = []
+        self._seq = itertools.count()
+
+    @property
+    def circuit_open(self) -> bool:
+        return self.failures >= self.failure_threshold
+
+    def check(self, run_class: str):
+        """
+        Raise RunRejected when new work of this class should not be started: the circuit is open or
+        the queue in front of it is too deep. Call it before doing anything that cannot be undone.
+        """
+        ahead = sum(count for name, count in self.queued.items() if PRIORITIES[name] <= PRIORITIES[run_class])
+        if self.max_queued and ahead >= self.max_queued:
+            self.rejected["overloaded"] += 1
+            raise RunRejected("overloaded", self._estimate_wait(ahead))
+        if self._check_circuit():
+            self._probe_deadline = time.monotonic() + self.cooldown
+            _reserved_probe.set(self)
+
+    @asynccontextmanager
+    async def slot(self, run_class: str):
+        if _reserved_probe.get() is self and self._probing:
+            _reserved_probe.set(None)
+            probe = True
+        else:
+            probe = self._check_circuit()
+        self._probe_deadline = float("inf")
+        try:
+            await self._acquire(run_class)
+        except BaseException:
+            if probe:
+                self._probing = False
+            raise
+        start = time.monotonic()
+        try:
+            yield
+        except self.failure_types:
+            self._record(False)
+            raise
+        except BaseException:
+            if probe:
+                self._probing = False
+            raise
+        else:
+            self._record(True)
+        finally:
+            self.avg_duration = 0.9 * self.avg_duration + 0.1 * (time.monotonic() - start)
+            self._release()
+
+    def _check_circuit(self) -> bool:
+        """
+        Returns True when the caller becomes the trial run of a half-open circuit.
+        Raises RunRejected while the circuit is open, and to everyone but the trial run once it is half-open.
+        """
+        if not self.circuit_open:
+            return False
+        now = time.monotonic()
+        remaining = self.open_until - now
+        if remaining <= 0 and (not self._probing or now >= self._probe_deadline):
+            self._probing = True
+            return True
+        self.rejected["circuit_open"] += 1
+        raise RunRejected("circuit_open", max(remaining, 1.0))
+
+    def _record(self, ok: bool):
+        was_open = self.circuit_open
+        self._probing = False
+        if ok:
+            if was_open:
+                logger.info("OpenAI circuit closed")
+            self.failures = 0
+            return
+        self.failures += 1
+        if self.circuit_open:
+            self.open_until = time.monotonic() + self.cooldown
+            if not was_open:
+                logger.warning("OpenAI circuit open after %d consecutive failures", self.failures)
+
+    async def _acquire(self, run_class: str):
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            admission_wait.observe(0.0, run_class=run_class)
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(self._waiters, [PRIORITIES[run_class], next(self._seq), future])
+        self.queued[run_class] += 1
+        start = loop.time()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Granted a slot in the same iteration it was cancelled: hand it on
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+        finally:
+            self.queued[run_class] -= 1
+            admission_wait.observe(loop.time() - start, run_class=run_class)
+
+    def _release(self):
+        self.active -= 1
+        while self._waiters and self.active < self.max_concurrent:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.active += 1
+                future.set_result(None)
+
+    def _estimate_wait(self, ahead: int) -> float:
+        return max(1.0, round(self.avg_duration * (ahead + 1) / self.max_concurrent))
+
+    def state(self) -> float:
+        """
+        0 closed, 1 open, 0.5 while a trial run is in progress.
+        """
+        if not self.circuit_open:
+            return 0.0
+        return 0.5 if self._probing else 1.0
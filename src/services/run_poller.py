@@ -0,0 +1,146 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+import openai
+from services.metrics import untraced_task
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled", "expired", "incomplete", "requires_action")
+
+Retrieve = Callable[[str, str], Awaitable[Any]]
+
+
+class _Waiter:
+    __slots__ = ("thread_id", "run_id", "future", "interval", "next_poll", "deadline", "polling")
+
+    def __init__(self, thread_id: str, run_id: str, future: asyncio.Future, interval: float, now: float, timeout: float):
+        self.thread_id = thread_id
+        self.run_id = run_id
+        self.future = future
+        self.interval = interval
+        self.next_poll = now + interval
+        self.deadline = now + timeout
+        self.polling = False
+
+
+class RunStatusPoller:
+    """
+    One polling loop shared by every coroutine waiting for a run to finish.
+    Each run is polled fast at first and then less often (interval grows by `backoff` up to
+    `max_interval`), all polls together stay under `max_rps`, and a 429 pauses polling for
+    the Retry-After period. Waiters are resolved through futures.
+    """
+    def __init__(
+        self,
+        retrieve: Retrieve,
+        max_rps: float = 20.0,
+        initial_interval: float = 0.25,
+        max_interval: float = 2.0,
+        backoff: float = 1.5
+    ):
+        self.retrieve = retrieve
+        self.max_rps = max_rps
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.waiters: Dict[Tuple[str, str], _Waiter] = {}
+        self.requests = 0
+        self.rate_limited = 0
+        self._blocked_until = 0.0
+        self._next_slot = 0.0
+        self._wakeup = asyncio.Event()
+        self._loop_task: Optional[asyncio.Task] = None
+        self._polls: Set[asyncio.Task] = set()
+
+    async def wait(self, thread_id: str, run_id: str, timeout: float = 60) -> Any:
+        loop = asyncio.get_running_loop()
+        key = (thread_id, run_id)
+        waiter = self.waiters.get(key)
+        if waiter is None:
+            waiter = _Waiter(thread_id, run_id, loop.create_future(), self.initial_interval, loop.time(), timeout)
+            self.waiters[key] = waiter
+            self._wakeup.set()
+            if self._loop_task is None or self._loop_task.done():
+                # Polls for every waiter, whichever handler started it
+                self._loop_task = untraced_task(self._run())
+        return await asyncio.shield(waiter.future)
+
+    def _resolve(self, waiter: _Waiter, result: Any = None, error: Optional[BaseException] = None):
+        self.waiters.pop((waiter.thread_id, waiter.run_id), None)
+        if waiter.future.done():
+            return
+        if error is not None:
+            waiter.future.set_exception(error)
+        else:
+            waiter.future.set_result(result)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while self.waiters:
+            now = loop.time()
+            for waiter in list(self.waiters.values()):
+                if waiter.deadline <= now and not waiter.polling:
+                    self._resolve(waiter, error=TimeoutError(
+                        f"Run {waiter.run_id} did not complete in time"
+                    ))
+            idle = [w for w in self.waiters.values() if not w.polling]
+            if idle:
+                waiter = min(idle, key=lambda w: w.next_poll)
+                poll_at = max(waiter.next_poll, self._blocked_until, self._next_slot)
+                if poll_at <= now:
+                    waiter.polling = True
+                    self._next_slot = now + 1.0 / self.max_rps
+                    task = asyncio.create_task(self._poll(waiter))
+                    self._polls.add(task)
+                    task.add_done_callback(self._polls.discard)
+                    continue
+                wake_at = min(poll_at, min(w.deadline for w in idle))
+            else:
+                wake_at = None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=None if wake_at is None else max(wake_at - now, 0))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, waiter: _Waiter):
+        loop = asyncio.get_running_loop()
+        try:
+            self.requests += 1
+            run = await self.retrieve(waiter.thread_id, waiter.run_id)
+        except openai.RateLimitError as e:
+            self.rate_limited += 1
+            retry_after = _retry_after(e) or self.max_interval
+            logger.warning("Run polling rate limited, pausing for %.1fs", retry_after)
+            self._blocked_until = max(self._blocked_until, loop.time() + retry_after)
+            waiter.next_poll = self._blocked_until
+        except (openai.APIConnectionError, openai.InternalServerError):
+            waiter.interval = min(waiter.interval * self.backoff, self.max_interval)
+            waiter.next_poll = loop.time() + waiter.interval
+        except Exception as e:
+            self._resolve(waiter, error=e)
+        else:
+            if getattr(run, "status", None) in TERMINAL_STATUSES:
+                self._resolve(waiter, result=run)
+            else:
+                waiter.interval = min(waiter.interval * self.backoff, self.max_interval)
+                waiter.next_poll = loop.time() + waiter.interval
+        finally:
+            waiter.polling = False
+            self._wakeup.set()
+
+    def in_flight(self) -> int:
+        return len(self.waiters)
+
+
+def _retry_after(error: openai.APIStatusError) -> Optional[float]:
+    headers = error.response.headers if error.response is not None else {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(header)
+        if value:
+            try:
+                return float(value) * scale
+            except ValueError:
+                pass
+    return None
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Optional
+from services.metrics import untraced_task
+
+logger = logging.getLogger(__name__)
+
+CreateThread = Callable[[], Awaitable[str]]
+PostWelcome = Callable[[str], Awaitable[Any]]
+
+
+@dataclass
+class ThreadPair:
+    thread_id: str
+    parser_thread_id: str
+    # OpenAI id of the welcome message already posted to the manager thread
+    welcome_message_id: Optional[str] = None
+
+
+class ThreadPool:
+    """
+    Manager/parser thread pairs created ahead of time, so a new blogger's chat does not wait for them.
+    A background task keeps `size` pairs ready (with the welcome message posted when post_welcome is given)
+    and acquire() falls back to creating a pair on the spot when the pool is empty.
+    Every worker has its own pool; start() only waits for the first `prefill` pairs.
+    Pairs are only kept in memory, the ones left at shutdown are simply never used.
+    """
+    def __init__(
+        self,
+        create_thread: CreateThread,
+        post_welcome: Optional[PostWelcome] = None,
+        size: int = 8,
+        prefill: int = 0,
+        retry_interval: float = 5.0
+    ):
+        self.create_thread = create_thread
+        self.post_welcome = post_welcome
+        self.size = size
+        self.prefill = prefill
+        self.retry_interval = retry_interval
+        self.pairs: Deque[ThreadPair] = deque()
+        self.hits = 0
+        self.misses = 0
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    async def start(self):
+        """
+        Create the first `prefill` pairs (app startup) and keep the pool filled in the background.
+        """
+        if self.size <= 0:
+            return
+        if self.prefill > 0:
+            await self._fill(min(self.prefill, self.size))
+        if self._task is None or self._task.done():
+            self._task = untraced_task(self._refill())
+
+    async def acquire(self) -> ThreadPair:
+        """
+        A ready pair from the pool, or a new one (both threads created concurrently, no welcome yet).
+        """
+        if self.pairs:
+            self.hits += 1
+            pair = self.pairs.popleft()
+            self._wakeup.set()
+            return pair
+        self.misses += 1
+        self._wakeup.set()
+        thread_id, parser_thread_id = await asyncio.gather(self.create_thread(), self.create_thread())
+        return ThreadPair(thread_id, parser_thread_id)
+
+    def give_back(self, pair: ThreadPair):
+        """
+        Return a pair that was acquired but not used (another worker created the chat first, or the insert failed).
+        It is handed out next; the refill may already have replaced it, the pool then stays one over size until used.
+        """
+        self.pairs.appendleft(pair)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _refill(self):
+        while True:
+            if len(self.pairs) >= self.size:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            if not await self._fill():
+                await asyncio.sleep(self.retry_interval)
+
+    async def _fill(self, target: Optional[int] = None) -> bool:
+        missing = (self.size if target is None else target) - len(self.pairs)
+        results = await asyncio.gather(*(self._create_pair() for _ in range(missing)), return_exceptions=True)
+        failed = [r for r in results if isinstance(r, Exception)]
+        self.pairs.extend(r for r in results if not isinstance(r, BaseException))
+        if failed:
+            logger.warning("Failed to pre-create %d OpenAI thread pairs: %r", len(failed), failed[0])
+        return not failed
+
+    async def _create_pair(self) -> ThreadPair:
+        thread_id, parser_thread_id = await asyncio.gather(self.create_thread(), self.create_thread())
+        pair = ThreadPair(thread_id, parser_thread_id)
+        if self.post_welcome is not None:
+            message = await self.post_welcome(thread_id)
+            pair.welcome_message_id = message.id
+        return pair
@@ -0,0 +1,84 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class ThreadState:
+    __slots__ = ("lock", "posted", "covered", "verified")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        # Messages posted to the thread so far / how many of them a finished run has already answered
+        self.posted = 0
+        self.covered = 0
+        # Whether the thread was checked remotely for runs left over from before a restart
+        self.verified = False
+
+
+class ThreadRunScheduler:
+    """
+    Serializes work on each OpenAI thread inside this process, instead of polling the API for a free thread.
+    Posting a message and running an assistant both take the thread's lock, so a message is never posted
+    while a run is active. Messages posted while a run was active are answered by a single follow-up run:
+    the later callers find their message already covered and get None back.
+    The lock is FIFO, so posts and runs happen in the order they were queued.
+    """
+    def __init__(self, remote_check: Callable[[str], Awaitable[None]]):
+        self.remote_check = remote_check
+        self.threads: Dict[str, ThreadState] = {}
+
+    def _state(self, thread_id: str) -> ThreadState:
+        state = self.threads.get(thread_id)
+        if state is None:
+            state = self.threads[thread_id] = ThreadState()
+        return state
+
+    async def _ensure_verified(self, thread_id: str, state: ThreadState):
+        if not state.verified:
+            await self.remote_check(thread_id)
+            state.verified = True
+
+    async def post(
+        self,
+        thread_id: str,
+        post: Callable[[], Awaitable[T]],
+        on_queued: Optional[Callable[[], None]] = None
+    ) -> Tuple[T, int]:
+        """
+        Post a message once no run is active. Returns the result and a ticket for run().
+        on_queued is called as the post takes its place in the thread's queue (nothing is awaited
+        in between), a caller keeping its messages in order can let the next one queue from there.
+        """
+        state = self._state(thread_id)
+        if on_queued is not None:
+            on_queued()
+        async with state.lock:
+            await self._ensure_verified(thread_id, state)
+            result = await post()
+            state.posted += 1
+            return result, state.posted
+
+    async def run(self, thread_id: str, run: Callable[[], Awaitable[T]], ticket: Optional[int] = None) -> Optional[T]:
+        """
+        Run the assistant over everything posted so far.
+        Returns None without running when a run for a later message already answered the ticket.
+        """
+        state = self._state(thread_id)
+        async with state.lock:
+            if ticket is not None and state.covered >= ticket:
+                return None
+            await self._ensure_verified(thread_id, state)
+            target = state.posted
+            try:
+                result = await run()
+            except BaseException:
+                # The remote run may still be active (timeout, cancellation), check again before the next message
+                state.verified = False
+                raise
+            state.covered = target
+            return result
+
+    def is_busy(self, thread_id: str) -> bool:
+        state = self.threads.get(thread_id)
+        return state is not None and state.lock.locked()
@@ -1,9 +1,100 @@
-from database.db_connection import supabase
+import asyncio
+from services.metrics import timed
+import hashlib
+import logging
+import time
+from typing import Optional, Tuple
+import jwt as pyjwt
+from database.db_connection import get_supabase
+from schemas import AuthUser
+from services.cache import TTLCache
+from services.env import get_env_var
 
-async def get_user_by_jwt(jwt: str):
-    if not jwt:
-        raise ValueError("JWT is required")
-    resp = await supabase.auth.get_user(jwt)
+logger = logging.getLogger(__name__)
+
+# "local" verifies tokens in-process and only calls the auth API when that is not possible, "remote" always calls it
+AUTH_MODE = get_env_var("AUTH_MODE", "remote")
+SUPABASE_JWT_SECRET = get_env_var("SUPABASE_JWT_SECRET", "")
+SUPABASE_JWKS_URL = get_env_var("SUPABASE_JWKS_URL", "")
+JWT_AUDIENCE = get_env_var("SUPABASE_JWT_AUDIENCE", "authenticated")
+
+# Validated tokens, each entry expires together with its token
+token_cache: TTLCache[AuthUser] = TTLCache(maxsize=int(get_env_var("AUTH_CACHE_SIZE", "10000")))
+
+_jwks_client: Optional[pyjwt.PyJWKClient] = None
+
+
+class LocalVerificationUnavailable(Exception):
+    pass
+
+
+def _cache_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def _get_jwks_client() -> pyjwt.PyJWKClient:
+    global _jwks_client
+    if _jwks_client is None:
+        url = SUPABASE_JWKS_URL or f"{get_env_var('SUPABASE_URL').rstrip('/')}/auth/v1/.well-known/jwks.json"
+        _jwks_client = pyjwt.PyJWKClient(url, cache_keys=True)
+    return _jwks_client
+
+async def _get_signing_key(token: str):
+    alg = pyjwt.get_unverified_header(token).get("alg")
+    if alg == "HS256":
+        if not SUPABASE_JWT_SECRET:
+            raise LocalVerificationUnavailable("SUPABASE_JWT_SECRET is not set")
+        return SUPABASE_JWT_SECRET, alg
+    try:
+        # PyJWKClient fetches over blocking urllib, keys are cached after the first call
+        signing_key = await asyncio.to_thread(_get_jwks_client().get_signing_key_from_jwt, token)
+    except pyjwt.PyJWKClientError as e:
+        raise LocalVerificationUnavailable(str(e))
+    return signing_key.key, alg
+
+@timed("auth.verify_local")
+async def verify_jwt_locally(token: str) -> Tuple[AuthUser, float]:
+    """
+    Verify a Supabase access token without calling the auth API.
+    Returns the user built from the claims and the token expiry (unix time).
+    """
+    try:
+        key, alg = await _get_signing_key(token)
+        claims = pyjwt.decode(token, key, algorithms=[alg], audience=JWT_AUDIENCE, options={"require": ["exp", "sub"]})
+    except pyjwt.InvalidTokenError as e:
+        raise ValueError(f"Invalid JWT: {e}")
+    user = AuthUser(id=claims["sub"], email=claims.get("email"), user_metadata=claims.get("user_metadata") or {})
+    return user, float(claims["exp"])
+
+@timed("supabase.auth.get_user")
+async def get_user_remotely(token: str) -> Tuple[AuthUser, Optional[float]]:
+    resp = await get_supabase().auth.get_user(token)
     if not resp.user:
         raise ValueError("User not found for provided JWT")
-    return resp.user
+    user = AuthUser(id=resp.user.id, email=resp.user.email, user_metadata=resp.user.user_metadata or {})
+    try:
+        # The auth server has validated the token, only its expiry is needed here
+        expires_at = float(pyjwt.decode(token, options={"verify_signature": False})["exp"])
+    except Exception:
+        expires_at = None
+    return user, expires_at
+
+async def get_user_by_jwt(jwt: str) -> AuthUser:
+    if not jwt:
+        raise ValueError("JWT is required")
+    key = _cache_key(jwt)
+    cached = token_cache.get(key)
+    if cached is not None:
+        return cached
+    user, expires_at = None, None
+    if AUTH_MODE == "local":
+        try:
+            user, expires_at = await verify_jwt_locally(jwt)
+        except LocalVerificationUnavailable as e:
+            logger.warning("Local JWT verification unavailable, falling back to the auth API: %s", e)
+    if user is None:
+        user, expires_at = await get_user_remotely(jwt)
+    if expires_at is not None:
+        ttl = expires_at - time.time()
+        if ttl > 0:
+            token_cache.set(key, user, ttl=ttl)
+    return user
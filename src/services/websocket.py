@@ -1,22 +1,154 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from services.chats import send_welcome_message_if_needed
+from services.chats import send_welcome_message_if_needed, get_cached_chat, invalidate_chat, chat_cache, thread_pool
 from services.connection_manager import ConnectionManager
-from services.users import get_user_by_jwt
-from database.messages import save_message, get_messages_page
-from services.llm import create_user_message_in_thread, process_assistant_response
+from services.chat_tasks import ChatTaskQueue
+from services.deal_updates import DealUpdateCoalescer
+from services.deals_snapshot import DealsSnapshot, parse_timestamp
+from services.deal_signals import DealSignalFilter
+from services.broadcast import create_broadcast_bus
+from services.env import get_env_var
+from services import wire
+from services.users import get_user_by_jwt, token_cache
+from services.metrics import registry, timed, trace
+from services.message_writer import message_writer
+from services.dispatcher import ConnectionDispatcher, OrderedKeys, current_request_id, release_order
+from database.messages import get_messages_page, get_messages_by_cursor
+from database.dashboard import get_dashboard, mark_chat_read
+from services.llm import create_user_message_in_thread, process_assistant_response, stream_assistant_response, extract_deal_fields, thread_scheduler, run_poller, run_admission, RunFailed
+from services.run_admission import RunRejected
+from services.compaction import compactor, run_context
 from schemas import MessageIn, DealData
-from database.deals import update_deal, get_all_deals
-from database.chats import get_chat
+from database.deals import update_deal
 import json
+import logging
 from datetime import datetime
+from functools import partial
+from typing import Optional
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-manager = ConnectionManager()
+manager = ConnectionManager(bus=create_broadcast_bus())
+
+PARSER_DRAIN_TIMEOUT = float(get_env_var("PARSER_DRAIN_TIMEOUT", "30"))
+# "assistant" runs the Parser Assistant on the chat's parser thread, "structured" makes one stateless completion
+PARSER_ENGINE = get_env_var("PARSER_ENGINE", "assistant")
+PARSER_WINDOW = int(get_env_var("PARSER_WINDOW", "12"))
+DEAL_PREFILTER = get_env_var("DEAL_PREFILTER", "true").lower() in ("1", "true", "yes")
+ASSISTANT_STREAMING = get_env_var("ASSISTANT_STREAMING", "true").lower() in ("1", "true", "yes")
+WS_MAX_IN_FLIGHT = int(get_env_var("WS_MAX_IN_FLIGHT", "8"))
+DASHBOARD_MAX_LIMIT = int(get_env_var("DASHBOARD_MAX_LIMIT", "500"))
+
+async def report_parser_error(chat_id: str, error: BaseException):
+    await manager.send_to_all_marketers({
+        "type": "deal_update_error",
+        "chat_id": chat_id,
+        "error": str(error)
+    })
+
+chat_tasks = ChatTaskQueue(on_error=report_parser_error)
+
+deal_signal_filter = DealSignalFilter(
+    direct_updates=get_env_var("DEAL_PREFILTER_DIRECT", "true").lower() in ("1", "true", "yes")
+)
+
+deals_snapshot = DealsSnapshot(
+    refresh_interval=float(get_env_var("DEALS_SNAPSHOT_REFRESH", "30")),
+    overlap=float(get_env_var("DEALS_SYNC_OVERLAP", "5"))
+)
+
+async def write_deal_update(chat_id: str, fields: dict):
+    deal_data = DealData(
+        chat_id=chat_id,
+        price_usd=fields.get("price_usd"),
+        availability=fields.get("availability"),
+        discounts=fields.get("discounts"),
+        status=fields.get("status")
+    )
+    response = await update_deal(deal_data)
+    deal = response.data[0] if response and response.data else None
+    if deal:
+        deals_snapshot.apply(deal)
+    # Encoded once per wire format for all marketer sockets
+    await manager.send_to_all_marketers({"deal_update": fields, "chat_id": chat_id, "deal": deal})
+
+async def apply_remote_deal_update(role: str, message: str):
+    # deal_update frames from other workers keep this worker's snapshot current
+    if '"deal_update"' not in message:
+        return
+    deal = wire.loads(message).get("deal")
+    if deal:
+        deals_snapshot.apply(deal)
+
+manager.remote_listeners.append(apply_remote_deal_update)
+
+# Changed chat rows are announced to the other workers under a role no socket has
+CHAT_UPDATES_ROLE = "_chat_updates"
+
+def apply_chat_update(update: dict):
+    """
+    Put a new chat summary into this worker's connections of the blogger and drop the cached row.
+    """
+    for conn in manager.by_user.get(update["blogger_id"], ()):
+        if conn.chat is not None:
+            conn.chat.update(summary=update["summary"], summary_cursor=update["summary_cursor"])
+    invalidate_chat(update["blogger_id"])
+
+async def apply_remote_chat_update(role: str, message: str):
+    if role != CHAT_UPDATES_ROLE:
+        return
+    update = wire.loads(message).get("chat_update")
+    if update:
+        apply_chat_update(update)
+
+manager.remote_listeners.append(apply_remote_chat_update)
+
+deal_updates = DealUpdateCoalescer(
+    write_deal_update,
+    window=float(get_env_var("DEAL_COALESCE_WINDOW", "0.5")),
+    on_error=report_parser_error
+)
+
+registry.gauge(
+    "bloggers_crm_websocket_connections", "Open WebSocket connections by role",
+    lambda: {role: len(conns) for role, conns in manager.by_role.items()}, label="role"
+)
+registry.gauge(
+    "bloggers_crm_websocket_send_queue", "Frames waiting in per-connection send queues",
+    lambda: sum(conn.queue.qsize() for conn in manager.connections.values())
+)
+registry.gauge("bloggers_crm_background_chats", "Chats with queued or running parser jobs", chat_tasks.active)
+registry.gauge("bloggers_crm_deal_updates_pending", "Chats with a deal update waiting to be written", lambda: len(deal_updates.pending))
+registry.gauge(
+    "bloggers_crm_openai_busy_threads", "Threads with a run in progress",
+    lambda: sum(1 for thread_id in thread_scheduler.threads if thread_scheduler.is_busy(thread_id))
+)
+registry.gauge("bloggers_crm_openai_runs_polled", "Runs currently being polled for completion", run_poller.in_flight)
+registry.counter("bloggers_crm_openai_poll_requests_total", "Run status requests sent", lambda: run_poller.requests)
+registry.counter("bloggers_crm_openai_poll_rate_limited_total", "Run status requests rejected with 429", lambda: run_poller.rate_limited)
+registry.counter(
+    "bloggers_crm_deal_prefilter_total", "Messages classified by the deal signal prefilter",
+    lambda: deal_signal_filter.counts, label="action"
+)
+registry.counter("bloggers_crm_chat_cache_hits_total", "Chat cache hits", lambda: chat_cache.hits)
+registry.counter("bloggers_crm_chat_cache_misses_total", "Chat cache misses", lambda: chat_cache.misses)
+registry.gauge("bloggers_crm_thread_pool_ready", "Pre-created thread pairs waiting for a new blogger", lambda: len(thread_pool.pairs))
+registry.counter("bloggers_crm_thread_pool_hits_total", "New chats that got a pre-created thread pair", lambda: thread_pool.hits)
+registry.counter("bloggers_crm_thread_pool_misses_total", "New chats that had to create their threads", lambda: thread_pool.misses)
+registry.counter("bloggers_crm_token_cache_hits_total", "Auth token cache hits", lambda: token_cache.hits)
+registry.counter("bloggers_crm_token_cache_misses_total", "Auth token cache misses", lambda: token_cache.misses)
+
+async def reply(websocket: WebSocket, payload: dict):
+    # Replies carry the request_id of the frame they answer, so clients can match them out of order
+    request_id = current_request_id.get()
+    if request_id is not None:
+        payload["request_id"] = request_id
+    await manager.send_personal_message(payload, websocket)
 
 async def init_user_connection(websocket: WebSocket, first_data: str):
     try:
-        first_json = json.loads(first_data)
+        first_json = wire.loads(first_data)
     except Exception:
         raise ValueError("Failed to parse initial data as JSON")
     token = first_json.get("access_token")
@@ -26,20 +158,92 @@ async def init_user_connection(websocket: WebSocket, first_data: str):
     if not user:
         raise ValueError("User not found in auth.users")    
     role = user.user_metadata["role"]
-    for conn in manager.active_connections:
-        if conn["ws"] == websocket:
-            conn["user_id"] = user.id
-            conn["role"] = role
-            break
+    chat = None
     if role == "blogger":
-        await send_welcome_message_if_needed(user.id)
+        chat = await send_welcome_message_if_needed(user.id)
+    # The auth frame is always JSON text, it picks the format of every frame after it
+    wire_format = wire.negotiate(first_json)
+    manager.bind_user(websocket, user.id, role, chat, wire_format)
+    await manager.send_personal_message({
+        "type": "connection_ready",
+        "user_id": user.id,
+        "role": role,
+        "encoding": wire_format.encoding,
+        "compression": wire_format.compression
+    }, websocket)
+
+def require_marketer(websocket: WebSocket):
+    conn = manager.get(websocket)
+    if not conn or conn.role != "marketer":
+        raise PermissionError("Only marketers can do this")
+    return conn
+
+async def resolve_chat(websocket: WebSocket):
+    conn = manager.get(websocket)
+    if not conn or not conn.user_id:
+        raise ValueError("User not authenticated")
+    if conn.chat is None:
+        conn.chat = await get_cached_chat(conn.user_id)
+    return conn.chat
+
+def chat_context(chat: dict) -> Optional[str]:
+    # Read when the run starts, so it carries the latest summary and deal
+    return run_context(chat, deals_snapshot.deals.get(chat["id"]))
+
+async def compact_chat(chat: dict):
+    cursor = chat.get("summary_cursor")
+    await compactor.compact(chat, deals_snapshot.deals.get(chat["id"]))
+    if chat.get("summary_cursor") == cursor:
+        return
+    update = {"blogger_id": chat["blogger_id"], "summary": chat["summary"], "summary_cursor": chat["summary_cursor"]}
+    apply_chat_update(update)
+    await manager.publish_to_role(CHAT_UPDATES_ROLE, {"chat_update": update})
+
+async def process_parser_and_update_deal(content: str, chat: dict):
+    # Traced on its own so background stages do not show up in the chat_message breakdown
+    async with trace("parser"):
+        try:
+            await _parse_and_submit(content, chat)
+        except RunRejected as e:
+            # Shed by admission control, not a failure marketers need to hear about
+            logger.info("Parser skipped for chat %s: %s", chat["id"], e)
+
+async def _parse_and_submit(content: str, chat: dict):
+    chat_id = chat["id"]
+    if DEAL_PREFILTER:
+        signals = deal_signal_filter.classify(content)
+        if signals.action == "skip":
+            return
+        if signals.action == "direct":
+            deal_updates.submit(chat_id, signals.fields)
+            return
+    if PARSER_ENGINE == "structured":
+        parsed_fields = await parse_with_structured_output(content, chat_id)
+    else:
+        parsed_fields = await parse_with_assistant(content, chat.get("parser_thread_id"), chat_context(chat))
+    if parsed_fields:
+        deal_updates.submit(chat_id, parsed_fields)
+
+async def parse_with_structured_output(content: str, chat_id: str) -> Optional[dict]:
+    page = await get_messages_by_cursor(chat_id, limit=PARSER_WINDOW, direction="before")
+    # Rows still in the write-behind queue are newer than anything the query returned
+    stored_ids = {m["id"] for m in page["messages"]}
+    messages = page["messages"] + [m for m in message_writer.pending(chat_id) if m["id"] not in stored_ids]
+    conversation = [
+        {"role": "user" if m["sender"] == "user" else "assistant", "content": m["content"]}
+        for m in messages[-PARSER_WINDOW:]
+    ]
+    if not conversation or conversation[-1] != {"role": "user", "content": content}:
+        conversation.append({"role": "user", "content": content})
+    fields = await extract_deal_fields(conversation)
+    return fields.model_dump(exclude_none=True) if fields else None
+
+async def parse_with_assistant(content: str, thread_id: str, context: Optional[str] = None) -> Optional[dict]:
 
-async def process_parser_and_update_deal(content: str, chat_id: str, thread_id: str):
-    
     # 1. Add user message to thread
-    await create_user_message_in_thread(content, thread_id)
+    parser_message = await create_user_message_in_thread(content, thread_id)
     # 2. Get parser assistant response
-    parser_response = await process_assistant_response("parser", thread_id)
+    parser_response = await process_assistant_response("parser", thread_id, parser_message["run_ticket"], context)
     
     # 3. Try to extract and parse fields from parser_response["content"]
     parsed_fields = None
@@ -66,36 +270,54 @@ async def process_parser_and_update_deal(content: str, chat_id: str, thread_id:
             except Exception:
                 parsed_fields = None
     
-    if parsed_fields:
-        deal_data = DealData(
-            chat_id=chat_id,
-            price_usd=parsed_fields.get("price_usd"),
-            availability=parsed_fields.get("availability"),
-            discounts=parsed_fields.get("discounts"),
-            status=parsed_fields.get("status")
-        )
-        await update_deal(deal_data)
-        await manager.send_to_all_marketers(json.dumps({"deal_update": parsed_fields, "chat_id": chat_id}))
+    return parsed_fields
 
+@timed("save_and_send_message")
 async def save_and_send_message(message_in: MessageIn, websocket: WebSocket):
-    await save_message(message_in)
-    await websocket.send_text(json.dumps({
+    # Echoed right away, the row is written by the batching writer
+    row = message_writer.submit(message_in)
+    await reply(websocket, {
         "type": "chat_message",
+        "id": row["id"],
         "chat_id": message_in.chat_id,
         "sender": message_in.sender,
         "content": message_in.content,
         "created_at": message_in.created_at,
         "openai_message_id": message_in.openai_message_id
-    }))
+    })
+
+async def run_manager_assistant(websocket: WebSocket, chat: dict, run_ticket: int) -> Optional[dict]:
+    chat_id, thread_id = chat["id"], chat.get("openai_thread_id")
+    if not ASSISTANT_STREAMING:
+        return await process_assistant_response("manager", thread_id, run_ticket, chat_context(chat))
+
+    async def send_delta(openai_message_id: str, delta: str):
+        await reply(websocket, {
+            "type": "chat_message_delta",
+            "chat_id": chat_id,
+            "sender": "manager",
+            "openai_message_id": openai_message_id,
+            "delta": delta
+        })
+
+    return await stream_assistant_response("manager", thread_id, send_delta, run_ticket, chat_context(chat))
 
 async def handle_chat_message(websocket: WebSocket, data_json: dict):
-    
+    try:
+        # Shed before the message is stored or posted, so the client can simply send it again
+        run_admission.check("manager")
+    except RunRejected as e:
+        await reply(websocket, {"type": "busy", "reason": e.reason, "retry_after": e.retry_after})
+        return
     content = data_json.get("content")
-    user_id = manager.get_user_id(websocket)
-    chat = await get_chat(user_id)
+    chat = await resolve_chat(websocket)
+    if not chat:
+        await reply(websocket, {"error": "Chat not found"})
+        return
     thread_id = chat.get("openai_thread_id")
-    parser_thread_id = chat.get("parser_thread_id")
-    user_message_in_thread = await create_user_message_in_thread(content, thread_id)
+    # Once the post is queued on the thread the next chat_message may queue its own behind it, so messages
+    # sent while a run is active are all posted before the follow-up run, which answers them together
+    user_message_in_thread = await create_user_message_in_thread(content, thread_id, on_queued=release_order)
     
     message_in_from_user = MessageIn(
         chat_id=chat["id"],
@@ -104,17 +326,24 @@ async def handle_chat_message(websocket: WebSocket, data_json: dict):
         openai_message_id=user_message_in_thread.get("id"),
         created_at=datetime.utcnow().isoformat()
     )
+    # Queued before anything is awaited, so the jobs of the chat's messages keep the order of the posts.
+    # Deal extraction runs in the background (in order per chat) so the manager reply is not blocked by it
+    chat_tasks.submit(chat["id"], partial(process_parser_and_update_deal, content, chat))
+    # Turns that fell out of the runs' window are folded into the chat summary, after the parser so it sees the new deal
+    if compactor.due(chat["id"]):
+        chat_tasks.submit(chat["id"], partial(compact_chat, chat))
     await save_and_send_message(message_in_from_user, websocket)
-    
-    await process_parser_and_update_deal(content, chat["id"], parser_thread_id)
-    if not chat:
-        await manager.send_personal_message(json.dumps({"error": "Chat not found"}), websocket)
+    assistant_response = await run_manager_assistant(websocket, chat, user_message_in_thread["run_ticket"])
+    if assistant_response is None:
+        # A run started for a later message of this blogger answers this one too
         return
-    assistant_response = await process_assistant_response("manager", thread_id)
-    content = assistant_response.get("content")
-    text_value = content[0].text.value
-    
-    
+    text_value = "".join(
+        part.text.value for part in assistant_response.get("content") or []
+        if getattr(part, "type", None) == "text" and part.text and part.text.value
+    )
+    if not text_value:
+        raise RunFailed(f"Assistant returned no reply on thread {thread_id}")
+
     message_in_from_llm = MessageIn(
         chat_id=chat["id"],
         sender="manager",
@@ -126,71 +355,229 @@ async def handle_chat_message(websocket: WebSocket, data_json: dict):
     
 
 
-async def handle_get_deals(websocket: WebSocket):
-    deals = await get_all_deals()
-    await manager.send_personal_message(json.dumps({"type": "deals_list", "deals": deals}), websocket)
+async def handle_get_deals(websocket: WebSocket, data_json: dict):
+    result = await deals_snapshot.query(
+        since=data_json.get("since"),
+        status=data_json.get("status"),
+        sort=data_json.get("sort", "updated_at"),
+        descending=data_json.get("order") == "desc",
+        limit=data_json.get("limit"),
+        offset=data_json.get("offset", 0)
+    )
+    await reply(websocket, {
+        "type": "deals_list",
+        "deals": result["deals"],
+        "total": result["total"],
+        "has_more": result["has_more"],
+        "cursor": result["cursor"],
+        "since": data_json.get("since")
+    })
 
 async def handle_get_existing_messages(websocket: WebSocket, data_json: dict):
-    user_id = manager.get_user_id(websocket)
-    
-    if not user_id:
-        raise ValueError("User not authenticated")
-    chat = await get_chat(user_id)
-
-    
+    chat = await resolve_chat(websocket)
+    if message_writer.pending(chat["id"]):
+        await message_writer.flush(chat["id"])
 
     limit = data_json.get("limit", 20)
+    # Only count when asked: "exact", "planned" or "estimated"
+    count = data_json.get("count")
+
+    if "cursor" in data_json or "direction" in data_json:
+        direction = data_json.get("direction", "before")
+        page = await get_messages_by_cursor(
+            chat["id"], limit=limit, cursor=data_json.get("cursor"), direction=direction, count=count
+        )
+        await reply(websocket, {
+            "type": "messages_page",
+            "messages": page["messages"],
+            "total_count": page["total_count"],
+            "has_more": page["has_more"],
+            "next_cursor": page["next_cursor"],
+            "direction": direction,
+            "limit": limit,
+            "chat_id": chat["id"]
+        })
+        return
+
     offset = data_json.get("offset", 0)
     
-    page = await get_messages_page(chat["id"], limit=limit, offset=offset)
+    page = await get_messages_page(chat["id"], limit=limit, offset=offset, count=count or "exact")
     
-    await manager.send_personal_message(json.dumps({
+    await reply(websocket, {
         "type": "messages_page",
         "messages": page["messages"],
         "total_count": page["total_count"],
         "limit": limit,
         "offset": offset,
         "chat_id": chat["id"]
-    }), websocket)
+    })
     
 
-async def handle_incoming_message(websocket: WebSocket, data: str):
-    data_json = json.loads(data)
+def merge_pending_messages(chats: list):
+    """
+    Put this worker's messages that are still waiting in the batching writer into dashboard rows
+    (latest message and message count). Unread counts catch up once the rows are written.
+    """
+    for row in chats:
+        stored_at = parse_timestamp(row.get("last_message_at"))
+        newer = [m for m in message_writer.pending(row["chat_id"]) if parse_timestamp(m["created_at"]) > stored_at]
+        if not newer:
+            continue
+        last = newer[-1]
+        row.update(
+            last_message_id=last["id"],
+            last_message_sender=last["sender"],
+            last_message_content=last["content"],
+            last_message_at=last["created_at"],
+            message_count=(row.get("message_count") or 0) + len(newer)
+        )
+
+async def handle_get_dashboard(websocket: WebSocket, data_json: dict):
+    conn = require_marketer(websocket)
+    sort = data_json.get("sort", "last_message_at")
+    limit = min(data_json.get("limit", 50), DASHBOARD_MAX_LIMIT)
+    offset = data_json.get("offset", 0)
+    result = await get_dashboard(
+        conn.user_id,
+        sort=sort,
+        descending=data_json.get("order", "desc") == "desc",
+        status=data_json.get("status"),
+        limit=limit,
+        offset=offset
+    )
+    merge_pending_messages(result["chats"])
+    await reply(websocket, {
+        "type": "dashboard",
+        "chats": result["chats"],
+        "total": result["total"],
+        "has_more": offset + len(result["chats"]) < result["total"],
+        "sort": sort,
+        "limit": limit,
+        "offset": offset
+    })
+
+async def handle_mark_chat_read(websocket: WebSocket, data_json: dict):
+    conn = require_marketer(websocket)
+    chat_id = data_json.get("chat_id")
+    if not chat_id:
+        raise ValueError("chat_id is required")
+    read_at = await mark_chat_read(conn.user_id, chat_id)
+    await reply(websocket, {"type": "chat_read", "chat_id": chat_id, "read_at": read_at})
+
+HANDLERS = {
+    "chat_message": handle_chat_message,
+    "get_deals": handle_get_deals,
+    "get_existing_messages": handle_get_existing_messages,
+    "get_dashboard": handle_get_dashboard,
+    "mark_chat_read": handle_mark_chat_read
+}
+
+# Frames that start one at a time per chat, in the order they arrived
+ORDERED_TYPES = {"chat_message"}
+chat_order = OrderedKeys()
+
+async def handle_incoming_message(websocket: WebSocket, data_json: dict):
     msg_type = data_json.get("type")
-    if msg_type == "chat_message":
-        await handle_chat_message(websocket, data_json)
-    elif msg_type == "get_deals":
-        await handle_get_deals(websocket)
-    elif msg_type == "get_existing_messages":
-        await handle_get_existing_messages(websocket, data_json)
+    handler = HANDLERS.get(msg_type)
+    if handler:
+        async with trace(msg_type):
+            await handler(websocket, data_json)
     else:
-        await manager.send_personal_message(json.dumps({"error": "Unknown message type"}), websocket)
+        await reply(websocket, {"error": "Unknown message type"})
+
+async def report_frame_error(websocket: WebSocket, data_json: dict, error: BaseException):
+    await reply(websocket, {"type": f"{data_json.get('type')}_error", "error": str(error)})
+
+async def report_frame_cancelled(websocket: WebSocket, data_json: dict):
+    await reply(websocket, {"type": f"{data_json.get('type')}_cancelled"})
+
+def frame_order_key(websocket: WebSocket, data_json: dict) -> Optional[str]:
+    if data_json.get("type") not in ORDERED_TYPES:
+        return None
+    return manager.get_chat_id(websocket) or manager.get_user_id(websocket)
+
+def create_dispatcher(websocket: WebSocket) -> ConnectionDispatcher:
+    return ConnectionDispatcher(
+        partial(handle_incoming_message, websocket),
+        on_error=partial(report_frame_error, websocket),
+        on_cancelled=partial(report_frame_cancelled, websocket),
+        order_key=partial(frame_order_key, websocket),
+        ordering=chat_order,
+        max_in_flight=WS_MAX_IN_FLIGHT
+    )
+
+async def receive_frame(websocket: WebSocket):
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+    text = message.get("text")
+    return text if text is not None else message.get("bytes")
+
+async def receive_frames(websocket: WebSocket, dispatcher: ConnectionDispatcher):
+    while True:
+        data = await receive_frame(websocket)
+        try:
+            data_json = wire.decode(data)
+        except Exception:
+            data_json = None
+        if not isinstance(data_json, dict):
+            await manager.send_personal_message({"type": "error", "error": "Invalid frame"}, websocket)
+            continue
+        request_id = data_json.get("request_id")
+        if data_json.get("type") == "cancel":
+            if not dispatcher.cancel(request_id):
+                await manager.send_personal_message({
+                    "type": "cancel_error",
+                    "request_id": request_id,
+                    "error": "No request in progress with this request_id"
+                }, websocket)
+            continue
+        if request_id is not None and dispatcher.in_flight(request_id):
+            await manager.send_personal_message({
+                "type": f"{data_json.get('type')}_error",
+                "request_id": request_id,
+                "error": "request_id is already in use"
+            }, websocket)
+            continue
+        dispatcher.dispatch(data_json)
 
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
+    dispatcher = create_dispatcher(websocket)
     try:
+        # The first message authenticates the connection
+        first_data = await websocket.receive_text()
         try:
-            # Read and process the first message for authentication
-            first_data = await websocket.receive_text()
-            await init_user_connection(websocket, first_data)
-            # Now process all subsequent messages
-            while True:
-                data = await websocket.receive_text()
-                await handle_incoming_message(websocket, data)
-        except WebSocketDisconnect:
-            # Client disconnected, just break out
-            pass
+            async with trace("auth"):
+                await init_user_connection(websocket, first_data)
         except Exception as e:
             try:
-                
-                data = await websocket.receive_text()
-                data_json = json.loads(data)
-                msg_type = data_json.get("type")
-                await websocket.send_text(json.dumps({"type": msg_type + "_error", "error": str(e)}))
-                await websocket.close()
+                await websocket.send_text(wire.dumps({"type": "auth_error", "error": str(e)}))
+                await websocket.close(code=1008)
             except Exception:
                 # Ignore errors if socket is already closed
                 pass
+            return
+        await receive_frames(websocket, dispatcher)
+    except WebSocketDisconnect:
+        pass
     finally:
-        manager.disconnect(websocket)
\ No newline at end of file
+        chat_id = manager.get_chat_id(websocket)
+        manager.disconnect(websocket)
+        # A chat_message still running keeps going until its reply is persisted
+        await dispatcher.close(timeout=PARSER_DRAIN_TIMEOUT)
+        if chat_id:
+            await chat_tasks.drain(chat_id, timeout=PARSER_DRAIN_TIMEOUT)
+
+async def start_websocket_services():
+    await message_writer.start()
+    await manager.start()
+    await thread_pool.start()
+
+async def shutdown_websocket_services():
+    await thread_pool.close()
+    await chat_tasks.shutdown(timeout=PARSER_DRAIN_TIMEOUT)
+    await deal_updates.close()
+    await manager.close()
+    await message_writer.close(timeout=PARSER_DRAIN_TIMEOUT)
\ No newline at end of file
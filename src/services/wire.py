@@ -0,0 +1,132 @@
+import json
+import zlib
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Union
+from services.env import get_env_var
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Payloads smaller than this are not worth compressing
+COMPRESS_MIN_BYTES = int(get_env_var("WS_COMPRESS_MIN_BYTES", "1024"))
+
+# First byte of a binary frame
+FLAG_MSGPACK = 0x01
+FLAG_DEFLATE = 0x02
+
+
+def dumps(payload: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(payload).decode()
+    return json.dumps(payload)
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def available_encodings():
+    return ("json", "msgpack") if msgpack is not None else ("json",)
+
+
+@dataclass(frozen=True)
+class WireFormat:
+    encoding: str = "json"
+    compression: str = "none"
+
+
+JSON = WireFormat()
+
+
+def negotiate(requested: Dict[str, Any]) -> WireFormat:
+    """
+    Pick the wire format from the auth frame's "encoding" and "compression" fields,
+    falling back to plain JSON for anything this process does not support.
+    """
+    encoding = requested.get("encoding", "json")
+    compression = requested.get("compression", "none")
+    return WireFormat(
+        encoding=encoding if encoding in available_encodings() else "json",
+        compression=compression if compression == "deflate" else "none"
+    )
+
+
+class Frame:
+    """
+    An outbound message. It is encoded at most once per wire format, however many sockets it goes to.
+    Created from a payload, or from JSON text that is only parsed if a socket needs another encoding.
+    """
+    __slots__ = ("_payload", "_text", "_encoded")
+
+    def __init__(self, payload: Any = None, text: Optional[str] = None):
+        self._payload = payload
+        self._text = text
+        self._encoded: Dict[WireFormat, Union[str, bytes]] = {}
+
+    @property
+    def payload(self) -> Any:
+        if self._payload is None and self._text is not None:
+            self._payload = loads(self._text)
+        return self._payload
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = dumps(self._payload)
+        return self._text
+
+    def encode(self, wire: WireFormat) -> Union[str, bytes]:
+        encoded = self._encoded.get(wire)
+        if encoded is None:
+            encoded = self._encoded[wire] = self._encode(wire)
+        return encoded
+
+    def _encode(self, wire: WireFormat) -> Union[str, bytes]:
+        if wire.encoding == "msgpack":
+            flags, data = FLAG_MSGPACK, msgpack.packb(self.payload, use_bin_type=True)
+        else:
+            flags, data = 0, None
+        if wire.compression == "deflate":
+            if data is None:
+                data = self.text.encode()
+            if len(data) >= COMPRESS_MIN_BYTES:
+                flags, data = flags | FLAG_DEFLATE, zlib.compress(data)
+        if flags == 0:
+            # Plain JSON goes out as a text frame
+            return self.text
+        return bytes([flags]) + data
+
+
+def as_frame(message: Union[Frame, dict, str]) -> Frame:
+    if isinstance(message, Frame):
+        return message
+    if isinstance(message, str):
+        return Frame(text=message)
+    return Frame(message)
+
+
+def decode(message: Union[str, bytes]) -> Any:
+    """
+    Parse an inbound frame: JSON text, or a binary frame with the same flag byte as outbound ones.
+    """
+    if isinstance(message, str):
+        return loads(message)
+    if not message:
+        raise ValueError("Empty frame")
+    flags, data = message[0], message[1:]
+    if flags & FLAG_DEFLATE:
+        data = zlib.decompress(data)
+    if flags & FLAG_MSGPACK:
+        if msgpack is None:
+            raise ValueError("msgpack is not available")
+        return msgpack.unpackb(data, raw=False)
+    return loads(data)
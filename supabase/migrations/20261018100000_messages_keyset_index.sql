@@ -0,0 +1,3 @@
+-- Index for keyset pagination of a chat's messages on (created_at, id)
+CREATE INDEX IF NOT EXISTS messages_chat_created_id_idx
+  ON public.messages (chat_id, created_at, id);
@@ -0,0 +1,15 @@
+-- Keep deals.updated_at current so clients can sync only the deals changed since their last fetch
+CREATE OR REPLACE FUNCTION public.set_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+  NEW.updated_at = now();
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER set_deals_updated_at
+BEFORE UPDATE ON public.deals
+FOR EACH ROW EXECUTE FUNCTION public.set_updated_at();
+
+CREATE INDEX IF NOT EXISTS deals_updated_at_idx
+  ON public.deals (updated_at);
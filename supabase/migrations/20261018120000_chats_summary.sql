@@ -0,0 +1,6 @@
+-- Rolling summary of the turns that fell out of the assistants' recent-message window.
+-- summary_cursor is the keyset cursor ((created_at, id) of messages) of the last summarized message.
+ALTER TABLE public.chats
+  ADD COLUMN IF NOT EXISTS summary text,
+  ADD COLUMN IF NOT EXISTS summary_cursor text,
+  ADD COLUMN IF NOT EXISTS summary_updated_at timestamptz;
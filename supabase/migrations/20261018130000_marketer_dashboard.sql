@@ -0,0 +1,113 @@
+-- Marketer dashboard: every chat with its blogger, latest message, message counts and deal in one call
+
+-- Last time each user read a chat, messages from the blogger after it are unread
+CREATE TABLE IF NOT EXISTS public.chat_reads (
+  user_id uuid REFERENCES auth.users(id) ON DELETE CASCADE,
+  chat_id uuid REFERENCES public.chats(id) ON DELETE CASCADE,
+  read_at timestamptz NOT NULL DEFAULT now(),
+  PRIMARY KEY (user_id, chat_id)
+);
+
+ALTER TABLE public.chat_reads ENABLE ROW LEVEL SECURITY;
+
+-- Unread counts: the blogger's messages of a chat after a point in time
+CREATE INDEX IF NOT EXISTS messages_chat_user_created_idx
+  ON public.messages (chat_id, created_at)
+  WHERE sender = 'user';
+
+-- Dashboard filtered by deal status
+CREATE INDEX IF NOT EXISTS deals_status_idx
+  ON public.deals (status);
+
+CREATE INDEX IF NOT EXISTS chats_created_at_idx
+  ON public.chats (created_at);
+
+-- Latest message per chat comes from messages_chat_created_id_idx (chat_id, created_at, id),
+-- the deal from the unique deals.chat_id index
+CREATE OR REPLACE VIEW public.chat_dashboard AS
+SELECT
+  c.id AS chat_id,
+  c.blogger_id,
+  u.email::text AS blogger_email,
+  coalesce(u.raw_user_meta_data->>'full_name', u.raw_user_meta_data->>'name') AS blogger_name,
+  c.created_at AS chat_created_at,
+  m.id AS last_message_id,
+  m.sender AS last_message_sender,
+  m.content AS last_message_content,
+  m.created_at AS last_message_at,
+  (SELECT count(*) FROM public.messages mc WHERE mc.chat_id = c.id) AS message_count,
+  d.price_usd,
+  d.availability,
+  d.discounts,
+  d.status AS deal_status,
+  d.updated_at AS deal_updated_at
+FROM public.chats c
+LEFT JOIN auth.users u ON u.id = c.blogger_id
+LEFT JOIN public.deals d ON d.chat_id = c.id
+LEFT JOIN LATERAL (
+  SELECT lm.id, lm.sender, lm.content, lm.created_at
+  FROM public.messages lm
+  WHERE lm.chat_id = c.id
+  ORDER BY lm.created_at DESC, lm.id DESC
+  LIMIT 1
+) m ON true;
+
+-- One page of the dashboard for p_user_id (unread counts are per user) as
+-- {"total": <chats matching the filter>, "chats": [...]}
+CREATE OR REPLACE FUNCTION public.get_dashboard(
+  p_user_id uuid,
+  p_sort text DEFAULT 'last_message_at',
+  p_descending boolean DEFAULT true,
+  p_status text DEFAULT NULL,
+  p_limit integer DEFAULT 50,
+  p_offset integer DEFAULT 0
+)
+RETURNS jsonb AS $$
+DECLARE
+  result jsonb;
+BEGIN
+  IF p_sort NOT IN (
+    'last_message_at', 'chat_created_at', 'message_count', 'unread_count',
+    'price_usd', 'deal_status', 'deal_updated_at', 'availability'
+  ) THEN
+    RAISE EXCEPTION 'Unsupported sort field: %', p_sort;
+  END IF;
+
+  EXECUTE format($query$
+    WITH rows AS (
+      SELECT
+        v.*,
+        (
+          SELECT count(*) FROM public.messages mu
+          WHERE mu.chat_id = v.chat_id AND mu.sender = 'user'
+            AND mu.created_at > coalesce(r.read_at, '-infinity')
+        ) AS unread_count
+      FROM public.chat_dashboard v
+      LEFT JOIN public.chat_reads r ON r.chat_id = v.chat_id AND r.user_id = $1
+      WHERE $2::text IS NULL OR v.deal_status = $2
+    ),
+    ranked AS (
+      SELECT rows.*, row_number() OVER (ORDER BY %I %s NULLS LAST, chat_id) AS position
+      FROM rows
+    )
+    SELECT jsonb_build_object(
+      'total', count(*),
+      'chats', coalesce(
+        jsonb_agg(to_jsonb(ranked) - 'position' ORDER BY position)
+          FILTER (WHERE position > $3 AND position <= $3 + $4),
+        '[]'::jsonb
+      )
+    )
+    FROM ranked
+  $query$, p_sort, CASE WHEN p_descending THEN 'DESC' ELSE 'ASC' END)
+  INTO result
+  USING p_user_id, p_status, greatest(p_offset, 0), greatest(p_limit, 0);
+
+  RETURN result;
+END;
+$$ LANGUAGE plpgsql STABLE SECURITY DEFINER SET search_path = public;
+
+-- Reads auth.users, so only the backend (service role) may call it
+REVOKE ALL ON FUNCTION public.get_dashboard(uuid, text, boolean, text, integer, integer) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.get_dashboard(uuid, text, boolean, text, integer, integer) TO service_role;
+REVOKE ALL ON public.chat_dashboard FROM anon, authenticated;
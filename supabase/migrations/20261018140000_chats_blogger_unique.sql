@@ -0,0 +1,4 @@
+-- One chat per blogger, so simultaneous first connects (from any worker) cannot create two.
+-- Fails if duplicates already exist: they have to be merged by hand first.
+ALTER TABLE public.chats
+  ADD CONSTRAINT chats_blogger_id_key UNIQUE (blogger_id);